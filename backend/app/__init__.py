@@ -5,9 +5,9 @@ from .config import configure_app
 from .models import User 
 from flask_jwt_extended import JWTManager
 
-def create_app():
+def create_app(database_uri=None):
     app = Flask(__name__)
-    configure_app(app)
+    configure_app(app, database_uri)
     db.init_app(app)
 
     # Use environment variable for the JWT secret key
@@ -15,9 +15,17 @@ def create_app():
 
     jwt = JWTManager(app)
 
-    with app.app_context():
-        db.create_all()
+    # Building the app never touches the database, so CLI commands such as
+    # create-database work before it exists; tables are created by init_db()
 
     from .routes import register_routes
     register_routes(app)
+
+    from .maintenance import register_commands
+    register_commands(app)
     return app
+
+def init_db(app):
+    # Creates missing tables; run on server start and by 'flask init-db'
+    with app.app_context():
+        db.create_all()
@@ -0,0 +1,149 @@
+import datetime
+from collections import defaultdict
+from sqlalchemy import func
+from .database import db
+from .models import ActivityRollup, Session
+
+BUCKET_SECONDS = 3600
+COUNTER_COLUMNS = (
+    'event_count', 'keystrokes', 'mouse_clicks', 'window_switches',
+    'gaze_samples', 'gaze_on_screen', 'focus_level_sum', 'focus_level_count',
+)
+
+def bucket_start(timestamp, bucket_seconds=BUCKET_SECONDS):
+    epoch = datetime.datetime(1970, 1, 1)
+    seconds = int((timestamp - epoch).total_seconds())
+    return epoch + datetime.timedelta(seconds=seconds - seconds % bucket_seconds)
+
+# Event data is client JSON: a malformed value must not raise, or one bad
+# item would abort the rollups (and the insert) of the whole batch
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+def as_point(value):
+    if isinstance(value, (list, tuple)) and len(value) >= 2 and is_number(value[0]) and is_number(value[1]):
+        return value[0], value[1]
+    return None
+
+def is_on_screen(data):
+    if 'on_screen' in data:
+        return bool(data['on_screen'])
+    position = as_point(data.get('adjusted_gaze_start_position')) or as_point(data.get('centroid'))
+    if position is None:
+        return False
+    x, y = position
+    width, height = as_point(data.get('screen_size')) or (float('inf'), float('inf'))
+    return 0 <= x < width and 0 <= y < height
+
+def event_deltas(event_type, data):
+    data = data if isinstance(data, dict) else {}
+    deltas = {'event_count': 1}
+    if event_type == 'keyboard_session':
+        deltas['keystrokes'] = as_int(data.get('key_strokes'))
+    elif event_type == 'mouse_click':
+        deltas['mouse_clicks'] = 1
+    elif event_type == 'active_window':
+        deltas['window_switches'] = 1
+    elif event_type == 'gaze_data':
+        deltas['gaze_samples'] = 1
+        deltas['gaze_on_screen'] = int(is_on_screen(data))
+    elif event_type == 'fixation':
+        # One fixation summarises `samples` gaze samples around its centroid
+        samples = as_int(data.get('samples'))
+        deltas['gaze_samples'] = samples
+        deltas['gaze_on_screen'] = samples if is_on_screen(data) else 0
+    elif event_type == 'focus_level' and is_number(data.get('level')):
+        deltas['focus_level_sum'] = int(data['level'])
+        deltas['focus_level_count'] = 1
+    return deltas
+
+def compute_rollups(rows):
+    """Sum counter deltas for a batch of ActivityLog row dicts per (session, bucket)."""
+    rollups = defaultdict(lambda: dict.fromkeys(COUNTER_COLUMNS, 0))
+    for row in rows:
+        key = (row['session_id'], bucket_start(row['timestamp']))
+        for column, value in event_deltas(row['event_type'], row.get('data')).items():
+            rollups[key][column] += value
+    return rollups
+
+def apply_rollups(rows):
+    """
+    Add a batch's counters to the rollup table inside the caller's transaction.
+
+    On PostgreSQL and SQLite this is one atomic INSERT ... ON CONFLICT DO UPDATE
+    per bucket, so concurrent ingest requests can't lose increments.
+    """
+    rollups = compute_rollups(rows)
+    if not rollups:
+        return
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        for (session_id, start), counters in rollups.items():
+            statement = insert(ActivityRollup).values(session_id=session_id, bucket_start=start, **counters)
+            statement = statement.on_conflict_do_update(
+                index_elements=['session_id', 'bucket_start'],
+                set_={column: getattr(ActivityRollup, column) + statement.excluded[column] for column in COUNTER_COLUMNS},
+            )
+            db.session.execute(statement)
+        return
+
+    for (session_id, start), counters in rollups.items():
+        rollup = ActivityRollup.query.filter_by(session_id=session_id, bucket_start=start).with_for_update().first()
+        if rollup is None:
+            db.session.add(ActivityRollup(session_id=session_id, bucket_start=start, **counters))
+        else:
+            for column, value in counters.items():
+                setattr(rollup, column, getattr(rollup, column) + value)
+
+def summarize(counters):
+    summary = {column: counters[column] for column in COUNTER_COLUMNS if not column.startswith('focus_level')}
+    summary['gaze_on_screen_ratio'] = (
+        counters['gaze_on_screen'] / counters['gaze_samples'] if counters['gaze_samples'] else None)
+    summary['focus_level'] = (
+        counters['focus_level_sum'] / counters['focus_level_count'] if counters['focus_level_count'] else None)
+    summary['focus_level_reports'] = counters['focus_level_count']
+    return summary
+
+def session_summary(session):
+    sums = db.session.query(*[func.coalesce(func.sum(getattr(ActivityRollup, c)), 0) for c in COUNTER_COLUMNS]) \
+        .filter(ActivityRollup.session_id == session.id).one()
+    buckets = ActivityRollup.query.filter_by(session_id=session.id).order_by(ActivityRollup.bucket_start).all()
+    return {
+        'session_id': session.id,
+        'start_time': session.start_time.isoformat() if session.start_time else None,
+        'end_time': session.end_time.isoformat() if session.end_time else None,
+        'totals': summarize(dict(zip(COUNTER_COLUMNS, sums))),
+        'buckets': [
+            dict(bucket_start=b.bucket_start.isoformat(), **summarize({c: getattr(b, c) for c in COUNTER_COLUMNS}))
+            for b in buckets
+        ],
+    }
+
+def user_buckets(user_id, start, end, bucket_seconds=BUCKET_SECONDS):
+    """Aggregate a user's rollups into buckets of `bucket_seconds` (a multiple of an hour)."""
+    sums = [func.sum(getattr(ActivityRollup, c)) for c in COUNTER_COLUMNS]
+    rows = db.session.query(ActivityRollup.bucket_start, *sums) \
+        .join(Session, Session.id == ActivityRollup.session_id) \
+        .filter(Session.user_id == user_id,
+                ActivityRollup.bucket_start >= start,
+                ActivityRollup.bucket_start < end) \
+        .group_by(ActivityRollup.bucket_start) \
+        .all()
+
+    # Hourly rows from the database are merged into coarser buckets here
+    merged = defaultdict(lambda: dict.fromkeys(COUNTER_COLUMNS, 0))
+    for row in rows:
+        key = bucket_start(row[0], bucket_seconds)
+        for column, value in zip(COUNTER_COLUMNS, row[1:]):
+            merged[key][column] += value or 0
+    return [dict(bucket_start=key.isoformat(), **summarize(merged[key])) for key in sorted(merged)]
@@ -1,6 +1,48 @@
-def configure_app(app):
+import os
+import datetime
+
+def env_flag(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+def engine_options(uri):
+    """
+    Connection pool settings, overridable through the environment.
+
+    Each worker process keeps up to DB_POOL_SIZE idle connections plus
+    DB_MAX_OVERFLOW burst connections, so concurrent ingest requests reuse
+    connections instead of opening one per request. A worker never runs
+    more than GUNICORN_THREADS requests at once, so the pool defaults to one
+    connection per thread with a small overflow; anything larger only holds
+    connections the database could give to other workers. Pre-ping drops
+    connections the server closed while idle, and recycling keeps them under
+    typical load balancer / RDS idle timeouts.
+    """
+    options = {
+        'pool_pre_ping': env_flag('DB_POOL_PRE_PING', True),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    }
+    # SQLite uses a single-connection pool for :memory: and has no server to pool against
+    if not uri.startswith('sqlite'):
+        options.update(
+            pool_size=int(os.getenv('DB_POOL_SIZE', os.getenv('GUNICORN_THREADS', 4))),
+            max_overflow=int(os.getenv('DB_MAX_OVERFLOW', 2)),
+            pool_timeout=int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        )
+    return options
+
+def configure_app(app, database_uri=None):
     from .secrets import get_database_uri
-    uri = get_database_uri()
+    uri = database_uri or get_database_uri()
     app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(uri)
     app.config['SECRET_KEY'] = 'fallback-secret-key'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Password hashing dominates /login CPU time; the cost is tuned per deployment
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD')
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = datetime.timedelta(
+        seconds=int(os.getenv('JWT_ACCESS_TOKEN_EXPIRES', 15 * 60)))
+    app.config['JWT_REFRESH_TOKEN_EXPIRES'] = datetime.timedelta(
+        seconds=int(os.getenv('JWT_REFRESH_TOKEN_EXPIRES', 30 * 24 * 3600)))
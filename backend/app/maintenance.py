@@ -0,0 +1,93 @@
+import datetime
+import click
+from sqlalchemy import delete, select
+from .database import db
+from .models import User, Session, ActivityLog, ActivityRollup
+from .secrets import ensure_database_exists
+
+# Raw event types that are aged out once they are older than the retention window.
+# Their counts live on in ActivityRollup, which is maintained at ingest time.
+AGED_OUT_EVENT_TYPES = ('gaze_data',)
+
+def ensure_indexes(engine):
+    """
+    Migration path for databases created before the indexes existed:
+    db.create_all() never alters existing tables, so create any missing index.
+    """
+    created = []
+    for table in (Session.__table__, ActivityLog.__table__, ActivityRollup.__table__):
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+            created.append(index.name)
+    return created
+
+def widen_columns(engine):
+    """
+    Migration path for columns that were widened after tables were created,
+    like User.password_hash for scrypt hashes. Only Postgres is altered:
+    SQLite does not enforce VARCHAR lengths.
+    """
+    if engine.dialect.name != 'postgresql':
+        return []
+    column = User.__table__.c.password_hash
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            f'ALTER TABLE "{User.__tablename__}" ALTER COLUMN {column.name} TYPE VARCHAR({column.type.length})')
+    return [f"{User.__tablename__}.{column.name}"]
+
+def age_out_raw_events(older_than_days, event_types=AGED_OUT_EVENT_TYPES, batch_size=10000):
+    """
+    Delete raw events of `event_types` older than the cutoff in small batches,
+    so the table is never locked for long. Returns the number of rows deleted.
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=older_than_days)
+    deleted = 0
+    while True:
+        # Uses ix_activity_log_event_type_timestamp
+        ids = db.session.execute(
+            select(ActivityLog.id)
+            .where(ActivityLog.event_type.in_(event_types), ActivityLog.timestamp < cutoff)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return deleted
+        db.session.execute(delete(ActivityLog).where(ActivityLog.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+
+def register_commands(app):
+    @app.cli.command('create-database')
+    def create_database():
+        """Create the configured Postgres database if it does not exist yet."""
+        if ensure_database_exists(app.config['SQLALCHEMY_DATABASE_URI']):
+            click.echo("Database created")
+        else:
+            click.echo("Nothing to create: database exists or is not Postgres")
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create any missing tables."""
+        from . import init_db
+        init_db(app)
+        click.echo("Tables created")
+
+    @app.cli.command('upgrade-indexes')
+    def upgrade_indexes():
+        """Create indexes missing from an existing database."""
+        for name in ensure_indexes(db.engine):
+            click.echo(f"Index ensured: {name}")
+
+    @app.cli.command('upgrade-columns')
+    def upgrade_columns():
+        """Widen columns that are narrower in an existing database."""
+        for name in widen_columns(db.engine):
+            click.echo(f"Column widened: {name}")
+
+    @app.cli.command('age-out-events')
+    @click.option('--days', default=30, show_default=True, help="Keep raw events newer than this many days.")
+    @click.option('--event-type', 'event_types', multiple=True, default=AGED_OUT_EVENT_TYPES, show_default=True)
+    @click.option('--batch-size', default=10000, show_default=True)
+    def age_out_events(days, event_types, batch_size):
+        """Delete old high-volume raw events that are already covered by rollups."""
+        deleted = age_out_raw_events(days, event_types, batch_size)
+        click.echo(f"Deleted {deleted} raw events older than {days} days")
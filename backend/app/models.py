@@ -1,19 +1,43 @@
 import datetime
+from functools import lru_cache
+from flask import current_app
 from .database import db
 from werkzeug.security import generate_password_hash, check_password_hash
 
+def password_hash_method():
+    # e.g. "pbkdf2:sha256:100000" or "scrypt:16384:8:1"; None keeps Werkzeug's default
+    return current_app.config.get('PASSWORD_HASH_METHOD')
+
+@lru_cache(maxsize=None)
+def stored_method_prefix(method):
+    # Werkzeug fills in defaults when storing, e.g. "pbkdf2" -> "pbkdf2:sha256:1000000",
+    # so compare against what it actually writes rather than the configured string
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), index=True, unique=True)
-    password_hash = db.Column(db.String(128))
+    # scrypt hashes are 162 characters
+    password_hash = db.Column(db.String(256))
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        method = password_hash_method()
+        if method:
+            self.password_hash = generate_password_hash(password, method=method)
+        else:
+            self.password_hash = generate_password_hash(password)
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def needs_rehash(self):
+        # Stored hashes look like "<method>$<salt>$<hash>"; rehash when the configured cost changed
+        method = password_hash_method()
+        return bool(method) and self.password_hash.split('$', 1)[0] != stored_method_prefix(method)
+
 class Session(db.Model):
+    __table_args__ = (db.Index('ix_session_user_start_time', 'user_id', 'start_time'),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     start_time = db.Column(db.DateTime, default=datetime.datetime.utcnow)
@@ -23,10 +47,36 @@ class Session(db.Model):
     user = db.relationship('User', backref=db.backref('sessions', lazy=True))
 
 class ActivityLog(db.Model):
+    # Indexes lead with the filter column and end with timestamp so per-session and
+    # per-type time-range queries are index range scans; timestamp alone serves retention
+    __table_args__ = (
+        db.Index('ix_activity_log_session_timestamp', 'session_id', 'timestamp'),
+        db.Index('ix_activity_log_event_type_timestamp', 'event_type', 'timestamp'),
+        db.Index('ix_activity_log_timestamp', 'timestamp'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.Integer, db.ForeignKey('session.id'))
     event_type = db.Column(db.String(50), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     data = db.Column(db.JSON)  # Storing the specific event data as JSON
 
-    session = db.relationship('Session', backref=db.backref('activity_logs', lazy=True))
+    session = db.relationship('Session', backref=db.backref('activity_logs', lazy='dynamic'))
+
+class ActivityRollup(db.Model):
+    # Per-session, per-hour aggregates maintained at ingest time for the analytics API
+    __table_args__ = (db.UniqueConstraint('session_id', 'bucket_start', name='uq_rollup_session_bucket'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('session.id'), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    event_count = db.Column(db.Integer, nullable=False, default=0)
+    keystrokes = db.Column(db.Integer, nullable=False, default=0)
+    mouse_clicks = db.Column(db.Integer, nullable=False, default=0)
+    window_switches = db.Column(db.Integer, nullable=False, default=0)
+    gaze_samples = db.Column(db.Integer, nullable=False, default=0)
+    gaze_on_screen = db.Column(db.Integer, nullable=False, default=0)
+    focus_level_sum = db.Column(db.Integer, nullable=False, default=0)
+    focus_level_count = db.Column(db.Integer, nullable=False, default=0)
+
+    session = db.relationship('Session', backref=db.backref('rollups', lazy='dynamic'))
@@ -1,8 +1,68 @@
+import json
+import datetime
 from flask import request, jsonify, current_app
 from werkzeug.security import check_password_hash
 from .database import db
-from .models import User, ActivityLog
-from flask_jwt_extended import create_access_token
+from .models import User, Session, ActivityLog
+from .analytics import apply_rollups, session_summary, user_buckets
+from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity, get_jwt
+
+MAX_BATCH_SIZE = 5000
+
+def parse_batch_body():
+    # Accept either a JSON array of events or NDJSON (one event per line)
+    body = request.get_data(as_text=True)
+    if not body or not body.strip():
+        return None
+    if request.mimetype == 'application/x-ndjson' or not body.lstrip().startswith('['):
+        items = []
+        for line in body.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)  # Reported as a rejected item
+        return items
+    try:
+        items = json.loads(body)
+    except ValueError:
+        return None
+    return items if isinstance(items, list) else None
+
+def to_naive_utc(timestamp):
+    # Timestamps are stored as naive UTC like the column defaults
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def validate_activity_item(item):
+    # Returns (row, error) for a single batch item
+    if not isinstance(item, dict):
+        return None, "Item is not a JSON object"
+    if 'session_id' not in item or 'event_type' not in item:
+        return None, "Missing required data"
+    if not isinstance(item['event_type'], str) or not 0 < len(item['event_type']) <= 50:
+        return None, "Invalid event_type"
+    try:
+        session_id = int(item['session_id'])
+    except (TypeError, ValueError):
+        return None, "Invalid session_id"
+
+    row = {
+        'session_id': session_id,
+        'event_type': item['event_type'],
+        'data': item.get('data'),
+        'timestamp': datetime.datetime.utcnow()
+    }
+    if item.get('timestamp') is not None:
+        try:
+            timestamp = datetime.datetime.fromisoformat(item['timestamp'])
+        except (TypeError, ValueError):
+            return None, "Invalid timestamp"
+        row['timestamp'] = to_naive_utc(timestamp)
+    return row, None
 
 def register_routes(app):
     @app.route('/register', methods=['POST'])
@@ -29,22 +89,161 @@ def register_routes(app):
             return jsonify({'message': 'Invalid username or password'}), 401
         
 
-        access_token = create_access_token(identity=data['username'])
+        if user.needs_rehash():
+            # Move the stored hash to the configured cost while we have the plaintext
+            user.set_password(data.get('password'))
+            db.session.commit()
+
+        # The user id rides along as a claim so authenticated uploads need no user lookup
+        claims = {'uid': user.id}
+        access_token = create_access_token(identity=user.username, additional_claims=claims)
+        refresh_token = create_refresh_token(identity=user.username, additional_claims=claims)
+        return jsonify(access_token=access_token, refresh_token=refresh_token), 200
+
+    @app.route('/token/refresh', methods=['POST'])
+    @jwt_required(refresh=True)
+    def refresh_token():
+        # A restarted client gets a fresh access token without another password hash
+        access_token = create_access_token(identity=get_jwt_identity(),
+                                           additional_claims={'uid': get_jwt()['uid']})
         return jsonify(access_token=access_token), 200
+
+    @app.route('/sessions', methods=['POST'])
+    @jwt_required()
+    def start_session():
+        body = request.get_json(silent=True)
+        session = Session(user_id=get_jwt()['uid'], session_data=body.get('data') if isinstance(body, dict) else None)
+        db.session.add(session)
+        db.session.commit()
+        return jsonify(session_id=session.id, start_time=session.start_time.isoformat()), 201
+
+    @app.route('/sessions/<int:session_id>/end', methods=['POST'])
+    @jwt_required()
+    def end_session(session_id):
+        session = db.session.get(Session, session_id)
+        if session is None or session.user_id != get_jwt()['uid']:
+            return jsonify({"message": "Session not found"}), 404
+        session.end_time = datetime.datetime.utcnow()
+        db.session.commit()
+        return jsonify(session_id=session.id, end_time=session.end_time.isoformat()), 200
     
     @app.route('/activity-log', methods=['POST'])
+    @jwt_required(optional=True)
     def log_activity():
         data = request.get_json()
         if not data or 'session_id' not in data or 'event_type' not in data:
             return jsonify({"message": "Missing required data"}), 400
+        try:
+            session_id = int(data['session_id'])
+        except (TypeError, ValueError):
+            return jsonify({"message": "Invalid session_id"}), 400
+        # Sessions that belong to a user only take events from that user
+        session = db.session.get(Session, session_id)
+        if session is None or (session.user_id is not None and session.user_id != get_jwt().get('uid')):
+            return jsonify({"message": "Session not found"}), 404
 
         new_log = ActivityLog(
-            session_id=data['session_id'],
+            session_id=session_id,
             event_type=data['event_type'],
+            timestamp=datetime.datetime.utcnow(),
             data=data.get('data')  # Additional data as JSON
         )
         db.session.add(new_log)
+        apply_rollups([{
+            'session_id': new_log.session_id,
+            'event_type': new_log.event_type,
+            'timestamp': new_log.timestamp,
+            'data': new_log.data
+        }])
         db.session.commit()
         return jsonify({"message": "Activity logged successfully"}), 201
 
+    @app.route('/activity-log/batch', methods=['POST'])
+    @jwt_required()
+    def log_activity_batch():
+        items = parse_batch_body()
+        if items is None:
+            return jsonify({"message": "Body must be a JSON array or NDJSON"}), 400
+        if len(items) > MAX_BATCH_SIZE:
+            return jsonify({"message": f"Batch exceeds {MAX_BATCH_SIZE} items"}), 413
+
+        validated = [validate_activity_item(item) for item in items]
+
+        # Look up every referenced session once instead of per row
+        session_ids = {row['session_id'] for row, error in validated if row}
+        known_sessions = set()
+        if session_ids:
+            # Uploads may only write to the caller's own sessions
+            query = db.session.query(Session.id).filter(Session.id.in_(session_ids),
+                                                        Session.user_id == get_jwt()['uid'])
+            known_sessions = {session_id for (session_id,) in query}
+
+        rows = []
+        results = []
+        for index, (row, error) in enumerate(validated):
+            if not error and row['session_id'] not in known_sessions:
+                error = "Unknown session_id"
+            if error:
+                results.append({"index": index, "status": "rejected", "error": error})
+            else:
+                rows.append(row)
+                results.append({"index": index, "status": "accepted"})
+
+        if rows:
+            # One transaction and one executemany for the whole batch
+            try:
+                db.session.bulk_insert_mappings(ActivityLog, rows)
+                apply_rollups(rows)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"Batch insert failed: {e}")
+                return jsonify({"message": "Failed to store batch"}), 500
+
+        return jsonify({
+            "accepted": len(rows),
+            "rejected": len(items) - len(rows),
+            "results": results
+        }), 207 if len(rows) < len(items) else 201
+
+    def current_user():
+        return User.query.filter_by(username=get_jwt_identity()).first()
+
+    def parse_time_arg(name, default):
+        value = request.args.get(name)
+        if value is None:
+            return default
+        # Compared against naive UTC columns, so offsets are applied here
+        return to_naive_utc(datetime.datetime.fromisoformat(value))
+
+    @app.route('/analytics/sessions/<int:session_id>', methods=['GET'])
+    @jwt_required()
+    def session_analytics(session_id):
+        user = current_user()
+        session = db.session.get(Session, session_id)
+        if user is None or session is None or session.user_id != user.id:
+            return jsonify({"message": "Session not found"}), 404
+        return jsonify(session_summary(session)), 200
 
+    @app.route('/analytics/focus', methods=['GET'])
+    @jwt_required()
+    def focus_analytics():
+        user = current_user()
+        if user is None:
+            return jsonify({"message": "User not found"}), 404
+        now = datetime.datetime.utcnow()
+        bucket_sizes = {'hour': 3600, 'day': 24 * 3600, 'week': 7 * 24 * 3600}
+        bucket = request.args.get('bucket', 'hour')
+        if bucket not in bucket_sizes:
+            return jsonify({"message": f"bucket must be one of {', '.join(bucket_sizes)}"}), 400
+        try:
+            start = parse_time_arg('start', now - datetime.timedelta(days=7))
+            end = parse_time_arg('end', now)
+        except ValueError:
+            return jsonify({"message": "start and end must be ISO timestamps"}), 400
+        return jsonify({
+            "bucket": bucket,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "buckets": user_buckets(user.id, start, end, bucket_sizes[bucket])
+        }), 200
@@ -1,52 +1,115 @@
-import psycopg2
-import boto3
+import os
 import json
-from botocore.exceptions import NoCredentialsError, ClientError
+import time
 
-def get_database_uri():
-    host = 'focus-app.cfa9q7ilvqdl.eu-west-2.rds.amazonaws.com'
-    dbname = 'focus-app'
-    default_db = 'postgres'  # Default database you can connect to
-    secret_name = "rds!db-ae373175-5f02-46bb-86f9-a5dacbd77a96"
-    region_name = "eu-west-2"
-    session = boto3.session.Session()
-    client = session.client(service_name='secretsmanager', region_name=region_name)
+DEFAULT_HOST = 'focus-app.cfa9q7ilvqdl.eu-west-2.rds.amazonaws.com'
+DEFAULT_DBNAME = 'focus-app'
+DEFAULT_SECRET_NAME = "rds!db-ae373175-5f02-46bb-86f9-a5dacbd77a96"
+DEFAULT_REGION = "eu-west-2"
+FALLBACK_URI = 'sqlite:///default.db'
+
+# Resolved URIs are kept for the life of the process, keyed by secret name
+_uri_cache = {}
 
+def read_cached_uri(cache_file, ttl):
     try:
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-        secret = get_secret_value_response['SecretString']
-        secret_dict = json.loads(secret)
-        print("Fetched Secret:", secret_dict)  # Log fetched secret
+        if time.time() - os.path.getmtime(cache_file) > ttl:
+            return None
+        with open(cache_file) as f:
+            return json.load(f).get('uri')
+    except (OSError, ValueError):
+        return None
 
-        if 'username' in secret_dict and 'password' in secret_dict:
-            # Connect to the default database to check if 'focus-app' exists and create it if it does not
-            connection = psycopg2.connect(
-                dbname=default_db,
-                user=secret_dict['username'],
-                password=secret_dict['password'],
-                host=host
-            )
-            connection.autocommit = True
-            cursor = connection.cursor()
-            cursor.execute(f"SELECT 1 FROM pg_catalog.pg_database WHERE datname = '{dbname}'")
-            exists = cursor.fetchone()
-            if not exists:
-                cursor.execute(f"CREATE DATABASE \"{dbname}\"")
-                print(f"Database {dbname} created successfully.")
-            cursor.close()
-            connection.close()
-
-            database_uri = f"postgresql://{secret_dict['username']}:{secret_dict['password']}@{host}/{dbname}"
-            return database_uri
-        else:
-            print("Secret is missing required keys.")  # Log missing keys
+def write_cached_uri(cache_file, uri):
+    # The URI contains the password: create the file readable by the owner only
+    tmp_path = f"{cache_file}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'uri': uri}, f)
+    os.replace(tmp_path, cache_file)
+
+def fetch_secret_uri(secret_name, region_name, host, dbname):
+    import boto3
+    from botocore.exceptions import NoCredentialsError, ClientError
 
+    session = boto3.session.Session()
+    client = session.client(service_name='secretsmanager', region_name=region_name)
+    try:
+        secret_dict = json.loads(client.get_secret_value(SecretId=secret_name)['SecretString'])
+        if 'username' in secret_dict and 'password' in secret_dict:
+            return f"postgresql://{secret_dict['username']}:{secret_dict['password']}@{host}/{dbname}"
+        print("Secret is missing required keys.")
     except NoCredentialsError:
         print("AWS credentials not available.")
     except ClientError as e:
         print(f"Client error: {e}. Check your AWS configuration and permissions.")
     except Exception as e:
         print(f"An error occurred: {e}")
+    return None
+
+def get_database_uri():
+    """
+    Resolve the database URI without touching the network when possible:
 
-    return 'sqlite:///default.db'  # Fallback URI
+    1. DATABASE_URL from the environment (local Postgres, SQLite for tests, ...)
+    2. The RDS secret from Secrets Manager, only when DB_SECRET_NAME or
+       USE_SECRETS_MANAGER is set. The result is cached in-process and, if
+       DB_SECRET_CACHE_FILE is set, on disk for DB_SECRET_CACHE_TTL seconds so
+       every worker of a multi-process server doesn't repeat the lookup.
+    3. A local SQLite file.
+    """
+    uri = os.getenv('DATABASE_URL')
+    if uri:
+        # Heroku-style URLs use the scheme SQLAlchemy no longer accepts
+        return uri.replace('postgres://', 'postgresql://', 1)
 
+    secret_name = os.getenv('DB_SECRET_NAME')
+    if not secret_name and os.getenv('USE_SECRETS_MANAGER', '').lower() not in ('1', 'true', 'yes'):
+        return FALLBACK_URI
+    secret_name = secret_name or DEFAULT_SECRET_NAME
+    if secret_name in _uri_cache:
+        return _uri_cache[secret_name]
+
+    cache_file = os.getenv('DB_SECRET_CACHE_FILE')
+    ttl = int(os.getenv('DB_SECRET_CACHE_TTL', 3600))
+    uri = read_cached_uri(cache_file, ttl) if cache_file else None
+    if uri is None:
+        uri = fetch_secret_uri(
+            secret_name,
+            os.getenv('DB_SECRET_REGION', DEFAULT_REGION),
+            os.getenv('DB_HOST', DEFAULT_HOST),
+            os.getenv('DB_NAME', DEFAULT_DBNAME),
+        )
+        if uri is None:
+            return FALLBACK_URI
+        if cache_file:
+            write_cached_uri(cache_file, uri)
+    _uri_cache[secret_name] = uri
+    return uri
+
+def ensure_database_exists(uri):
+    """
+    Create the Postgres database named in `uri` if it is missing. This used to
+    run on every app start; it is now a one-off deploy step (flask create-database),
+    which works on a fresh server because building the app does not connect.
+    """
+    from sqlalchemy.engine import make_url
+    url = make_url(uri)
+    if not url.drivername.startswith('postgresql'):
+        return False
+    import psycopg2
+    from psycopg2 import sql
+
+    # Connect to the default database to check if the target exists
+    connection = psycopg2.connect(
+        dbname='postgres', user=url.username, password=url.password, host=url.host, port=url.port)
+    connection.autocommit = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_catalog.pg_database WHERE datname = %s", (url.database,))
+            if cursor.fetchone():
+                return False
+            cursor.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(url.database)))
+            return True
+    finally:
+        connection.close()
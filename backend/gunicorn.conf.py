@@ -0,0 +1,43 @@
+"""
+Gunicorn settings for serving wsgi:app. Every value can be overridden from
+the environment, so deployments are sized without editing this file.
+
+Each worker process has its own SQLAlchemy pool, sized by default to
+GUNICORN_THREADS plus a small overflow. The default worker count is capped
+at MAX_WORKERS so a large host does not exhaust the database's connection
+limit (Postgres defaults to 100): keep workers * (DB_POOL_SIZE +
+DB_MAX_OVERFLOW) below it when overriding either.
+"""
+import os
+import multiprocessing
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+MAX_WORKERS = 8
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, MAX_WORKERS)))
+# Ingest requests spend most of their time waiting on the database, so each
+# worker serves several at once on threads
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Recycle workers now and then to bound memory growth
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+
+# Build the app (config lookup) once in the master instead of in every worker
+preload_app = True
+
+def when_ready(server):
+    # Create missing tables once, in the master, before any worker is forked
+    from wsgi import app
+    from app import init_db
+    init_db(app)
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared with forked workers
+    from wsgi import app
+    from app.database import db
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -1,6 +1,9 @@
-from app import create_app
+import os
+from app import create_app, init_db
 
 app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    init_db(app)
+    # Development server only; use gunicorn with wsgi.py in production
+    app.run(debug=os.getenv('FLASK_DEBUG', '1') == '1')
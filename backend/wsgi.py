@@ -0,0 +1,11 @@
+"""
+Production entry point:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Tables are created by gunicorn.conf.py once the master is up; with another
+server run 'flask init-db' first.
+"""
+from app import create_app
+
+app = create_app()
@@ -1,10 +1,88 @@
 import os
+import json
+from threading import Lock
 import requests
 from tkinter import messagebox
+from model_registry import ADJUSTMENT_MODEL_PATH
+
+API_URL = os.getenv('FOCUS_API_URL', 'http://localhost:5000')
+TOKEN_FILE = os.getenv('FOCUS_TOKEN_FILE', 'auth_token.json')
+
+class TokenStore:
+    """
+    Keeps the JWTs from /login on disk so a restarted client can refresh its
+    access token instead of sending the password (and paying for a password
+    hash on the server) again. Shared by the GUI thread and the uploader thread.
+    """
+    def __init__(self, path=TOKEN_FILE):
+        self.path = path
+        self.lock = Lock()
+        self.tokens = {}
+        try:
+            with open(path) as f:
+                self.tokens = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    @property
+    def username(self):
+        return self.tokens.get('username')
+
+    def has_refresh_token(self):
+        return bool(self.tokens.get('refresh_token'))
+
+    def save(self, **tokens):
+        with self.lock:
+            self.tokens.update(tokens)
+            # Tokens are credentials: create the file readable by the owner only
+            tmp_path = f"{self.path}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.tokens, f)
+            os.replace(tmp_path, self.path)
+
+    def clear(self):
+        with self.lock:
+            self.tokens = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def headers(self):
+        access_token = self.tokens.get('access_token')
+        return {'Authorization': f"Bearer {access_token}"} if access_token else {}
+
+    def refresh(self, timeout=10):
+        # Returns True when a new access token was stored
+        refresh_token = self.tokens.get('refresh_token')
+        if not refresh_token:
+            return False
+        try:
+            response = requests.post(f"{API_URL}/token/refresh", timeout=timeout,
+                                     headers={'Authorization': f"Bearer {refresh_token}"})
+        except requests.RequestException:
+            return False
+        if response.status_code in (401, 422):
+            # Refresh token expired or revoked: a password login is needed again
+            self.clear()
+            return False
+        if not response.ok:
+            return False
+        self.save(access_token=response.json()['access_token'])
+        return True
+
+    def post(self, path, timeout=10, **kwargs):
+        # Authenticated POST that refreshes the access token once on 401
+        response = requests.post(f"{API_URL}{path}", headers=self.headers(), timeout=timeout, **kwargs)
+        if response.status_code == 401 and self.refresh():
+            response = requests.post(f"{API_URL}{path}", headers=self.headers(), timeout=timeout, **kwargs)
+        return response
+
+token_store = TokenStore()
 
 def has_been_calibrated(username):
-    # Check if a file exists indicating the user has been calibrated
-    return os.path.exists(f'calibration_{username}.txt')
+    # Check if a file exists indicating the user has been calibrated. Calibrations from before
+    # the fitted mapper have the marker but no mapper file, and would run uncalibrated
+    return os.path.exists(f'calibration_{username}.txt') and os.path.exists(ADJUSTMENT_MODEL_PATH)
 
 def mark_as_calibrated(username):
     # Create a file to mark the user as calibrated
@@ -13,7 +91,7 @@ def mark_as_calibrated(username):
 
 def register_user(username, password):
     try:
-        response = requests.post("http://localhost:5000/register", json={"username": username, "password": password})
+        response = requests.post(f"{API_URL}/register", json={"username": username, "password": password})
         if response.ok:
             messagebox.showinfo("Register", "Registration Successful")
         else:
@@ -23,8 +101,11 @@ def register_user(username, password):
 
 def login_user(username, password):
     try:
-        response = requests.post("http://localhost:5000/login", json={"username": username, "password": password})
+        response = requests.post(f"{API_URL}/login", json={"username": username, "password": password})
         if response.ok:
+            tokens = response.json()
+            token_store.save(username=username, access_token=tokens.get('access_token'),
+                             refresh_token=tokens.get('refresh_token'))
             messagebox.showinfo("Login", "Login Successful")
             return True  # Return True if login is successful
         else:
@@ -34,6 +115,36 @@ def login_user(username, password):
         messagebox.showerror("Login", str(e))
         return False  # Return False if an exception occurs
 
+def resume_login():
+    """
+    Reuse the stored refresh token from a previous run. Returns the username
+    when it is still valid, None when a password login is required.
+    """
+    if token_store.has_refresh_token() and token_store.refresh():
+        return token_store.username
+    return None
+
+def logout_user():
+    token_store.clear()
+
+def start_session(timeout=10):
+    # Create a backend Session row for this monitoring run; returns its id or None
+    try:
+        response = token_store.post("/sessions", json={}, timeout=timeout)
+    except requests.RequestException as e:
+        print(f"Starting a session failed: {e}")
+        return None
+    if response.status_code != 201:
+        print(f"Starting a session failed with status {response.status_code}")
+        return None
+    return response.json()['session_id']
+
+def end_session(session_id, timeout=10):
+    try:
+        token_store.post(f"/sessions/{session_id}/end", timeout=timeout)
+    except requests.RequestException as e:
+        print(f"Ending the session failed: {e}")
+
 def predict_gaze(image_data):
     # This function should handle image data accordingly.
     pass
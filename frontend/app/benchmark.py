@@ -0,0 +1,347 @@
+"""
+Benchmark the gaze pipeline stages on recorded input instead of a live webcam.
+
+Usage:
+    python benchmark.py --source clip.mp4 --output bench.json
+    python benchmark.py --source frames_dir/ --compare previous_bench.json
+    python benchmark.py --source synthetic --frames 200 --skip-inference
+    python benchmark.py --source clip.mp4 --preprocess
+    python benchmark.py --replay-check
+
+`--source synthetic` renders a simple face and uses a fixed face box, so the
+landmark, crop and inference stages can be timed in CI without a camera.
+`--preprocess` compares the time and bytes allocated per frame of the original
+eye-crop code against the buffer-reusing EyeCropper. `--replay-check` writes
+a short synthetic clip, replays it through the camera source and the threaded
+GazePipeline, and exits non-zero if frames go missing or no gaze comes out.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+import resource
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+import numpy as np
+import cv2
+import dlib
+from model_registry import registry, GAZE_MODEL_PATH, ADJUSTMENT_MODEL_PATH, SHAPE_PREDICTOR_PATH
+from camera_source import VideoFileSource, open_camera_source
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+SYNTHETIC_SIZE = (640, 480)
+SYNTHETIC_FACE_BOX = (220, 130, 420, 370)
+
+def synthetic_face_frames(count, size=SYNTHETIC_SIZE, seed=0):
+    # A drawn face with slight per-frame jitter and sensor noise
+    rng = np.random.default_rng(seed)
+    width, height = size
+    left, top, right, bottom = SYNTHETIC_FACE_BOX
+    center = ((left + right) // 2, (top + bottom) // 2)
+    for _ in range(count):
+        frame = np.full((height, width, 3), 90, dtype=np.uint8)
+        dx, dy = rng.integers(-3, 4, size=2)
+        cx, cy = center[0] + dx, center[1] + dy
+        cv2.ellipse(frame, (cx, cy), (95, 120), 0, 0, 360, (150, 180, 215), -1)
+        for side in (-1, 1):
+            eye = (cx + side * 40, cy - 25)
+            cv2.ellipse(frame, eye, (20, 10), 0, 0, 360, (255, 255, 255), -1)
+            cv2.circle(frame, (eye[0] + int(dx), eye[1]), 6, (40, 30, 20), -1)
+            cv2.line(frame, (eye[0] - 22, eye[1] - 22), (eye[0] + 22, eye[1] - 25), (40, 40, 60), 4)
+        cv2.line(frame, (cx, cy - 15), (cx, cy + 25), (110, 140, 180), 3)
+        cv2.ellipse(frame, (cx, cy + 60), (35, 12), 0, 0, 180, (60, 60, 160), 3)
+        noise = rng.integers(-6, 7, size=frame.shape, dtype=np.int16)
+        yield np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+def fixed_face_detector(box=SYNTHETIC_FACE_BOX):
+    rectangle = dlib.rectangle(*box)
+    return lambda gray: [rectangle]
+
+def iter_frames(source, limit=None):
+    if source == 'synthetic':
+        yield from synthetic_face_frames(limit or 300)
+        return
+    count = 0
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if limit is not None and count >= limit:
+                return
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                frame = cv2.imread(os.path.join(source, name))
+                if frame is not None:
+                    count += 1
+                    yield frame
+        return
+    cap = VideoFileSource(source).open()
+    try:
+        while limit is None or count < limit:
+            ret, frame = cap.read_latest()
+            if not ret:
+                break
+            count += 1
+            yield frame
+    finally:
+        cap.release()
+
+class StageTimer:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.hits = defaultdict(int)
+
+    def time(self, stage, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        self.samples[stage].append(time.perf_counter() - start)
+        if result is not None:
+            self.hits[stage] += 1
+        return result
+
+    def summary(self):
+        stages = {}
+        for stage, samples in self.samples.items():
+            ms = np.array(samples) * 1000
+            stages[stage] = {
+                'calls': len(samples),
+                'success_rate': self.hits[stage] / len(samples),
+                'mean_ms': float(ms.mean()),
+                'p50_ms': float(np.percentile(ms, 50)),
+                'p90_ms': float(np.percentile(ms, 90)),
+                'p99_ms': float(np.percentile(ms, 99)),
+                'max_ms': float(ms.max()),
+                'per_second': float(len(ms) / (ms.sum() / 1000)) if ms.sum() > 0 else None,
+            }
+        return stages
+
+def run_benchmark(source, frame_limit=None, tracking=True, skip_inference=False):
+    from image_processor import ImageProcessor
+    from gaze_predictor import GazePredictor
+
+    shape_predictor = registry.get('shape_predictor', SHAPE_PREDICTOR_PATH)
+    detector = fixed_face_detector() if source == 'synthetic' else registry.get('face_detector')
+    image_processor = ImageProcessor(detector, shape_predictor)
+    gaze_predictor = GazePredictor(
+        model_path=GAZE_MODEL_PATH,
+        adjustment_model_path=ADJUSTMENT_MODEL_PATH,
+        shape_predictor_path=SHAPE_PREDICTOR_PATH,
+        screen_dimensions=(1920, 1080),
+        tracking=tracking,
+    )
+    if not skip_inference:
+        gaze_predictor.warm_up()
+
+    timer = StageTimer()
+    frames = 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    for frame in iter_frames(source, frame_limit):
+        frames += 1
+        timer.time('image_processor.get_combined_eyes', image_processor.get_combined_eyes, frame, detector, shape_predictor)
+        combined_eyes = timer.time('gaze_predictor.get_combined_eyes', gaze_predictor.get_combined_eyes, frame, detector, shape_predictor)
+        if combined_eyes is None or skip_inference:
+            continue
+        # Time the traced model call itself, without the server's batching deadline
+        predicted_gaze = timer.time('inference', gaze_predictor.inference_server.predict_batch, combined_eyes[np.newaxis])[0]
+        timer.time('adjustment', gaze_predictor.adjustment_model.map_point, predicted_gaze[0], predicted_gaze[1])
+    elapsed = time.perf_counter() - start
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if not skip_inference:
+        gaze_predictor.inference_server.stop()
+
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    max_rss_mb = max_rss / (1024 * 1024) if sys.platform == 'darwin' else max_rss / 1024
+
+    detections = timer.hits['gaze_predictor.get_combined_eyes']
+    return {
+        'created_at': datetime.now().isoformat(),
+        'source': source,
+        'tracking': tracking,
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'frames': frames,
+        'elapsed_s': elapsed,
+        'frames_per_second': frames / elapsed if elapsed > 0 else None,
+        'detection_rate': detections / frames if frames else None,
+        'peak_traced_memory_mb': peak_traced / (1024 * 1024),
+        'max_rss_mb': max_rss_mb,
+        'gaze_predictor_stages': gaze_predictor.get_stage_timings(),
+        'stages': timer.summary(),
+    }
+
+def legacy_crop(frame, landmarks, target_size=(200, 100)):
+    # The per-frame preprocessing as it was before EyeCropper, kept as a baseline
+    from eye_crop import EYE_REGION_POINTS
+    cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    region = np.array([(landmarks.part(point).x, landmarks.part(point).y) for point in EYE_REGION_POINTS])
+    min_x, min_y = np.min(region[:, 0]), np.min(region[:, 1])
+    max_x, max_y = np.max(region[:, 0]), np.max(region[:, 1])
+    cropped = frame[min_y:max_y, min_x:max_x]
+    if cropped.size == 0:
+        return None
+    resized = cv2.resize(cropped, target_size, interpolation=cv2.INTER_AREA)
+    return resized.astype(np.float32) / 255.0
+
+def measure_call(fn, *args):
+    # Returns (seconds, peak bytes allocated during the call)
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    return elapsed, peak - baseline
+
+def profile_preprocessing(source, frame_limit=None):
+    from eye_crop import EyeCropper
+
+    shape_predictor = registry.get('shape_predictor', SHAPE_PREDICTOR_PATH)
+    detector = fixed_face_detector() if source == 'synthetic' else registry.get('face_detector')
+    cropper = EyeCropper()
+
+    def cropper_path(frame, landmarks):
+        cropper.gray(frame)
+        return cropper.crop(frame, landmarks)
+
+    samples = {'legacy': [], 'eye_cropper': []}
+    tracemalloc.start()
+    for frame in iter_frames(source, frame_limit):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = list(detector(gray))
+        if not faces:
+            continue
+        landmarks = shape_predictor(gray, faces[0])
+        samples['legacy'].append(measure_call(legacy_crop, frame, landmarks))
+        samples['eye_cropper'].append(measure_call(cropper_path, frame, landmarks))
+    tracemalloc.stop()
+
+    results = {}
+    for name, measurements in samples.items():
+        if not measurements:
+            continue
+        times = np.array([m[0] for m in measurements]) * 1000
+        allocated = np.array([m[1] for m in measurements])
+        results[name] = {
+            'frames': len(measurements),
+            'p50_ms': float(np.percentile(times, 50)),
+            'p99_ms': float(np.percentile(times, 99)),
+            'mean_bytes_allocated': float(allocated.mean()),
+        }
+        print(f"{name:12} p50 {results[name]['p50_ms']:.3f}ms  p99 {results[name]['p99_ms']:.3f}ms  "
+              f"{results[name]['mean_bytes_allocated'] / 1024:.1f} KiB allocated per frame")
+    return results
+
+def write_synthetic_clip(path, count, fps=15):
+    width, height = SYNTHETIC_SIZE
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    try:
+        for frame in synthetic_face_frames(count):
+            writer.write(frame)
+    finally:
+        writer.release()
+
+def replay_check(frame_count=60, timeout=60):
+    """Returns a list of failures from replaying a generated clip; empty means it passed."""
+    from gaze_predictor import GazePredictor
+    from gaze_pipeline import GazePipeline
+
+    failures = []
+    directory = tempfile.mkdtemp(prefix='replay_check_')
+    try:
+        clip_path = os.path.join(directory, 'synthetic.avi')
+        write_synthetic_clip(clip_path, frame_count)
+
+        # The replay source returns every frame in order and then reports the end
+        cap = open_camera_source(clip_path)
+        frames = 0
+        try:
+            while cap.read_latest()[0]:
+                frames += 1
+        finally:
+            cap.release()
+        if frames != frame_count:
+            failures.append(f"replay returned {frames} of {frame_count} frames")
+
+        # The synthetic face is drawn at a fixed box, so the pipeline gets a fixed detector
+        registry.replace('face_detector', None, fixed_face_detector())
+        gaze_predictor = GazePredictor(
+            model_path=GAZE_MODEL_PATH,
+            adjustment_model_path=ADJUSTMENT_MODEL_PATH,
+            shape_predictor_path=SHAPE_PREDICTOR_PATH,
+            screen_dimensions=(1920, 1080),
+        )
+        gaze_predictor.warm_up()
+        results = []
+        pipeline = GazePipeline(gaze_predictor, on_result=results.append, camera=clip_path)
+        pipeline.start()
+        # Capture stops the pipeline once the clip has ended
+        deadline = time.monotonic() + timeout
+        while pipeline.running.is_set() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        pipeline.stop()
+        stats = pipeline.get_stats()
+        if stats['frames_captured'] != frame_count:
+            failures.append(f"pipeline captured {stats['frames_captured']} of {frame_count} frames")
+        if not any(result['gaze'][0] is not None for result in results):
+            failures.append("pipeline produced no gaze predictions")
+        print(f"Replayed {frame_count} frames: {len(results)} predictions, {stats['dropped_frames']} dropped")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return failures
+
+def compare(results, previous):
+    print(f"{'stage':40} {'p50 before':>12} {'p50 now':>12} {'change':>8}")
+    for stage, summary in results['stages'].items():
+        before = previous.get('stages', {}).get(stage)
+        if not before:
+            continue
+        change = (summary['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0.0
+        print(f"{stage:40} {before['p50_ms']:10.2f}ms {summary['p50_ms']:10.2f}ms {change:+7.1f}%")
+
+def print_results(results):
+    print(f"{results['frames']} frames from {results['source']} at {results['frames_per_second']:.1f} fps, "
+          f"detection rate {results['detection_rate']:.0%}, peak traced memory {results['peak_traced_memory_mb']:.1f} MB, "
+          f"max RSS {results['max_rss_mb']:.0f} MB")
+    for stage, summary in results['stages'].items():
+        print(f"{stage:40} p50 {summary['p50_ms']:7.2f}ms  p90 {summary['p90_ms']:7.2f}ms  p99 {summary['p99_ms']:7.2f}ms")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the gaze pipeline on recorded frames.")
+    parser.add_argument('--source', default='synthetic', help="Video file, directory of frames, or 'synthetic'")
+    parser.add_argument('--frames', type=int, default=None, help="Maximum number of frames to process")
+    parser.add_argument('--no-tracking', action='store_true', help="Run full face detection on every frame")
+    parser.add_argument('--skip-inference', action='store_true', help="Only time detection and cropping")
+    parser.add_argument('--output', default='bench_results.json', help="Where to write the JSON results")
+    parser.add_argument('--compare', default=None, help="Previous results file to compare against")
+    parser.add_argument('--preprocess', action='store_true', help="Compare legacy and EyeCropper preprocessing")
+    parser.add_argument('--replay-check', action='store_true', help="Check the pipeline end to end on a generated clip")
+    args = parser.parse_args(argv)
+
+    if args.replay_check:
+        failures = replay_check(args.frames or 60)
+        for failure in failures:
+            print(f"FAILED: {failure}")
+        sys.exit(1 if failures else 0)
+
+    if args.preprocess:
+        results = profile_preprocessing(args.source, args.frames)
+        with open(args.output, 'w') as f:
+            json.dump({'source': args.source, 'preprocessing': results}, f, indent=4)
+        return
+
+    results = run_benchmark(args.source, args.frames, tracking=not args.no_tracking, skip_inference=args.skip_inference)
+    print_results(results)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import time
+import heapq
+import queue
+from threading import Thread, Event, Lock
+import cv2
+import numpy as np
+from camera_source import open_camera_source
+
+class CalibrationCapture:
+    """
+    Captures calibration samples off the Tk thread.
+
+    While a dot is armed, a background thread streams camera frames, crops
+    the eyes and scores each crop by sharpness (variance of the Laplacian)
+    discounted by landmark motion since the previous frame, so blinks,
+    saccades and motion blur lose out. The `frames_per_point` best crops are
+    posted to `results` once enough frames were seen or `timeout` passed;
+    the UI polls it with `after`. If capturing fails, the result carries an
+    `error` and no crops, and the point can be armed again. Frames in the first `settle_time` seconds
+    are skipped while the eyes move onto the dot. The camera is opened on
+    first use and released after `idle_release` seconds without a point.
+    """
+    def __init__(self, image_processor, camera=None, frames_per_point=5, min_frames=10, max_frames=30,
+                 timeout=2.0, settle_time=0.3, idle_release=10.0):
+        self.image_processor = image_processor
+        self.camera = camera
+        self.frames_per_point = frames_per_point
+        self.min_frames = min_frames
+        self.max_frames = max_frames
+        self.timeout = timeout
+        self.settle_time = settle_time
+        self.idle_release = idle_release
+        self.results = queue.Queue()
+        self.lock = Lock()
+        self.armed = None
+        self.wake = Event()
+        self.running = Event()
+        self.thread = None
+        self.cap = None
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.running.set()
+            self.thread = Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+
+    @property
+    def busy(self):
+        return self.armed is not None
+
+    def capture_point(self, index, coords):
+        """Start collecting samples for calibration point `index`; returns False if one is in progress."""
+        with self.lock:
+            if self.armed is not None:
+                return False
+            self.armed = (index, coords, time.monotonic())
+        self.wake.set()
+        return True
+
+    def open_camera(self):
+        if self.cap is None:
+            self.cap = open_camera_source(self.camera)
+        return self.cap
+
+    def release_camera(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def run(self):
+        try:
+            while self.running.is_set():
+                # Sleep until a point is armed; give the camera back if nothing happens for a while
+                if not self.wake.wait(self.idle_release):
+                    self.release_camera()
+                    continue
+                self.wake.clear()
+                if self.armed is not None:
+                    index, coords, armed_time = self.armed
+                    try:
+                        result = self.collect(index, coords, armed_time)
+                    except Exception as e:
+                        # A camera or dlib failure must not leave the UI waiting on this point
+                        print(f"Calibration capture failed: {e}")
+                        self.release_camera()
+                        result = {"index": index, "coords": coords, "crops": [], "frames": 0, "error": str(e)}
+                    finally:
+                        with self.lock:
+                            self.armed = None
+                    self.results.put(result)
+        finally:
+            self.release_camera()
+
+    def score(self, crop, points, previous_points):
+        # Sharp crops with steady landmarks score highest
+        sharpness = float(cv2.Laplacian(crop, cv2.CV_32F).var())
+        motion = 0.0
+        if previous_points is not None:
+            motion = float(np.abs(points - previous_points).mean())
+        return sharpness / (1.0 + motion)
+
+    def collect(self, index, coords, armed_time):
+        cap = self.open_camera()
+        processor = self.image_processor
+        best = []  # Min-heap of (score, sequence, crop), so the worst kept crop is popped first
+        frames = 0
+        previous_points = None
+        while self.running.is_set():
+            elapsed = time.monotonic() - armed_time
+            if elapsed > self.settle_time + self.timeout or frames >= self.max_frames:
+                break
+            if frames >= self.min_frames and len(best) >= self.frames_per_point:
+                break
+            ret, frame = cap.read_latest()
+            if not ret:
+                continue
+            if elapsed < self.settle_time:
+                continue
+            frames += 1
+            crop = processor.get_combined_eyes(frame, processor.detector, processor.predictor)
+            if crop is None:
+                previous_points = None
+                continue
+            points = processor.last_eye_points().astype(np.float32)
+            score = self.score(crop, points, previous_points)
+            previous_points = points
+            # The processor reuses its crop buffer, so keep copies
+            if len(best) < self.frames_per_point:
+                heapq.heappush(best, (score, frames, crop.copy()))
+            elif score > best[0][0]:
+                heapq.heapreplace(best, (score, frames, crop.copy()))
+        crops = [crop for _, _, crop in sorted(best, reverse=True)]
+        return {"index": index, "coords": coords, "crops": crops, "frames": frames}
@@ -1,13 +1,13 @@
 import tkinter as tk
 import pyautogui as pag
-from PIL import Image
-import cv2
-import pickle
-import numpy as np
+import queue
 from image_processor import ImageProcessor
+from calibration_capture import CalibrationCapture
+from session_format import CalibrationWriter
 
 class CalibrationComponent:
-    def __init__(self, root, on_calibration_complete, image_processor):
+    def __init__(self, root, on_calibration_complete, image_processor, frames_per_point=5,
+                 output_directory='calibration_data', poll_interval=30):
         self.root = root
         self.on_calibration_complete = on_calibration_complete
         self.image_processor = image_processor
@@ -15,13 +15,17 @@ class CalibrationComponent:
         self.calibration_points = []
         self.current_point = 0
         self.calibration_dot = None
-        self.data_X = []  # List to store images
-        self.data_y = []  # List to store gaze coordinates
+        self.poll_interval = poll_interval
         self.generate_calibration_points()
+        # Frames are captured and scored on a background thread; samples are written as each point finishes
+        self.capture = CalibrationCapture(image_processor, frames_per_point=frames_per_point)
+        self.capture.start()
+        self.writer = CalibrationWriter(output_directory, len(self.calibration_points) * frames_per_point)
+        self.status_label = tk.Label(self.root, text="Look at the dot and press space")
+        self.status_label.place(relx=0.5, rely=0.5, anchor='center')
         self.display_point()
         self.root.bind('<space>', self.handle_spacebar)
-        # Initialize the webcam
-        self.cap = cv2.VideoCapture(0)  # Argument is the index of the webcam
+        self.root.protocol('WM_DELETE_WINDOW', self.cancel)
 
     def generate_calibration_points(self):
         offset = 20
@@ -52,34 +56,47 @@ class CalibrationComponent:
         else:
             self.on_calibration_complete()
 
-    def capture_and_process_image(self):
-        # Capture image from the webcam
-        ret, frame = self.cap.read()
-        if not ret:
-            print("Failed to capture image from webcam")
-            return None, None
-        processed_image = self.image_processor.get_combined_eyes(frame, self.image_processor.detector, self.image_processor.predictor)
-        return processed_image, self.calibration_points[self.current_point]
-
     def handle_spacebar(self, event):
-        processed_image, gaze_coords = self.capture_and_process_image()
-        if processed_image is not None:
-            self.data_X.append(processed_image)
-            self.data_y.append(gaze_coords)
-            self.current_point += 1
-            if self.current_point >= len(self.calibration_points):
-                self.save_data()
-                self.on_calibration_complete()
-                self.cap.release()  # Release the webcam resource
+        # Returns immediately; the capture thread reports back through poll_capture
+        if self.current_point >= len(self.calibration_points):
+            return
+        if self.capture.capture_point(self.current_point, self.calibration_points[self.current_point]):
+            self.calibration_dot.config(fg='orange')
+            self.status_label.config(text="Capturing...")
+            self.root.after(self.poll_interval, self.poll_capture)
+
+    def poll_capture(self):
+        try:
+            result = self.capture.results.get_nowait()
+        except queue.Empty:
+            self.root.after(self.poll_interval, self.poll_capture)
+            return
+        if not result["crops"]:
+            self.calibration_dot.config(fg='red')
+            if result.get("error"):
+                self.status_label.config(text=f"Capture failed ({result['error']}), press space to try again")
             else:
-                self.display_point()
+                self.status_label.config(text="No face detected, look at the dot and press space again")
+            return
+        self.writer.add(result["crops"], result["coords"])
+        self.status_label.config(text=f"Point {self.current_point + 1}/{len(self.calibration_points)} captured")
+        self.current_point += 1
+        if self.current_point >= len(self.calibration_points):
+            self.finish()
+        else:
+            self.display_point()
+
+    def finish(self):
+        self.capture.stop()  # Releases the webcam
+        self.writer.close()
+        print(f"Data saved to {self.writer.directory}")
+        self.display_point()
 
-    def save_data(self):
-        # Save all collected data to a pickle file
-        calibration_data = {'images': self.data_X, 'gaze_coords': self.data_y}
-        with open('calibration_data.pkl', 'wb') as f:
-            pickle.dump(calibration_data, f)
-        print("Data saved to calibration_data.pkl")
+    def cancel(self):
+        # Closing the window abandons this calibration: stop the camera and keep the previous set
+        self.capture.stop()
+        self.writer.discard()
+        self.root.destroy()
 
 def on_calibration_complete():
     print("Calibration complete!")
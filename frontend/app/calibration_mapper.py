@@ -0,0 +1,143 @@
+"""
+Closed-form mapping from the gaze model's normalised predictions to
+calibrated normalised screen coordinates.
+
+The mapper is a 2-D polynomial (degree 1 is an affine map) fit by least
+squares on the calibration points. It is stored as a handful of NumPy arrays
+in an .npz file and always loaded with allow_pickle=False.
+"""
+import os
+import numpy as np
+
+MAPPER_FORMAT = 'focus-calibration-mapper'
+FORMAT_VERSION = 1
+
+def polynomial_exponents(degree):
+    # (i, j) for every term x**i * y**j with i + j <= degree, constant term first
+    return [(total - j, j) for total in range(degree + 1) for j in range(total + 1)]
+
+class CalibrationMapper:
+    """
+    Least-squares polynomial calibration. predict() maps whole arrays;
+    map_point() maps one point with plain float arithmetic, which is what the
+    per-frame path uses.
+    """
+    def __init__(self, degree=2, ridge=1e-6):
+        self.degree = degree
+        self.ridge = ridge
+        self.exponents = polynomial_exponents(degree)
+        # Identity until fit, so an uncalibrated client uses the raw predictions
+        self.input_offset = np.zeros(2)
+        self.input_scale = np.ones(2)
+        self.coefficients = np.zeros((len(self.exponents), 2))
+        self.coefficients[self.exponents.index((1, 0)), 0] = 1.0
+        self.coefficients[self.exponents.index((0, 1)), 1] = 1.0
+        self.point_errors = np.empty(0)
+        self.cache_coefficients()
+
+    def cache_coefficients(self):
+        # Python floats for map_point: faster than NumPy on a single point
+        self.terms = [(i, j, float(cx), float(cy)) for (i, j), (cx, cy) in zip(self.exponents, self.coefficients)]
+        self.offset_x, self.offset_y = (float(v) for v in self.input_offset)
+        self.scale_x, self.scale_y = (float(v) for v in self.input_scale)
+
+    def design_matrix(self, points):
+        normalised = (points - self.input_offset) / self.input_scale
+        x, y = normalised[:, 0:1], normalised[:, 1:2]
+        return np.hstack([x ** i * y ** j for i, j in self.exponents])
+
+    def fit(self, predicted, actual, error_scale=(1.0, 1.0)):
+        """
+        Fit predicted (n, 2) -> actual (n, 2). The degree is lowered when there
+        are too few points to determine every term. Returns the residual of each
+        calibration point, with x and y multiplied by `error_scale` (pass the
+        screen size to get pixels).
+        """
+        predicted = np.asarray(predicted, dtype=np.float64).reshape(-1, 2)
+        actual = np.asarray(actual, dtype=np.float64).reshape(-1, 2)
+        if len(predicted) != len(actual):
+            raise ValueError("predicted and actual must have the same number of points")
+        if len(predicted) < 3:
+            raise ValueError("At least 3 calibration points are needed")
+        while len(polynomial_exponents(self.degree)) > len(predicted):
+            self.degree -= 1
+        self.exponents = polynomial_exponents(self.degree)
+
+        # Centre and scale the inputs so higher-order terms stay well conditioned
+        self.input_offset = predicted.mean(axis=0)
+        self.input_scale = np.maximum(predicted.std(axis=0), 1e-6)
+        design = self.design_matrix(predicted)
+        # Ridge-regularised normal equations; the constant term is not penalised
+        penalty = self.ridge * np.eye(design.shape[1])
+        penalty[0, 0] = 0.0
+        self.coefficients = np.linalg.solve(design.T @ design + penalty, design.T @ actual)
+        self.cache_coefficients()
+        self.point_errors = np.linalg.norm((self.predict(predicted) - actual) * np.asarray(error_scale), axis=1)
+        return self.point_errors
+
+    def with_coefficients(self, coefficients):
+        # A new mapper with the same input normalisation; the original is left untouched
+        mapper = CalibrationMapper(degree=self.degree, ridge=self.ridge)
+        mapper.input_offset = self.input_offset
+        mapper.input_scale = self.input_scale
+        mapper.coefficients = np.array(coefficients, dtype=np.float64)
+        mapper.point_errors = self.point_errors
+        mapper.cache_coefficients()
+        return mapper
+
+    def predict(self, points):
+        # Accepts (2,) or (n, 2); always returns (n, 2), like a scikit-learn regressor
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        return self.design_matrix(points) @ self.coefficients
+
+    def map_point(self, x, y):
+        x = (float(x) - self.offset_x) / self.scale_x
+        y = (float(y) - self.offset_y) / self.scale_y
+        out_x = out_y = 0.0
+        for i, j, cx, cy in self.terms:
+            term = x ** i * y ** j
+            out_x += cx * term
+            out_y += cy * term
+        return out_x, out_y
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write-then-rename so a running client never loads a half-written file
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            format=np.array(MAPPER_FORMAT), version=np.array(FORMAT_VERSION),
+            degree=np.array(self.degree), ridge=np.array(self.ridge),
+            input_offset=self.input_offset, input_scale=self.input_scale,
+            coefficients=self.coefficients, point_errors=self.point_errors,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            if str(data['format']) != MAPPER_FORMAT:
+                raise ValueError(f"{path} is not a {MAPPER_FORMAT} file")
+            if int(data['version']) > FORMAT_VERSION:
+                raise ValueError(f"{path} was written by a newer version of the app")
+            mapper = cls(degree=int(data['degree']), ridge=float(data['ridge']))
+            mapper.input_offset = data['input_offset']
+            mapper.input_scale = data['input_scale']
+            mapper.coefficients = data['coefficients']
+            mapper.point_errors = data['point_errors']
+        mapper.cache_coefficients()
+        return mapper
+
+def fit_report(point_errors):
+    errors = np.asarray(point_errors)
+    if not len(errors):
+        return {"points": 0}
+    return {
+        "points": len(errors),
+        "mean_error": float(errors.mean()),
+        "median_error": float(np.median(errors)),
+        "max_error": float(errors.max()),
+        "point_errors": [round(float(e), 1) for e in errors],
+    }
@@ -0,0 +1,204 @@
+"""
+Camera sources shared by the gaze pipeline and calibration.
+
+Live cameras are opened with a small capture resolution, a capped frame rate
+and a one-frame driver buffer: the model only sees a 200x100 eye crop, so
+decoding full-resolution frames is wasted work and buffered frames are
+stale by the time they are read. Settings default to the values below and
+can be overridden through FOCUS_CAMERA_* environment variables.
+
+FOCUS_CAMERA selects the source: a camera index, or a video file / image
+sequence pattern (e.g. frames/%04d.png) that is replayed instead, which is
+how the pipeline is exercised without a webcam.
+"""
+import os
+import time
+from threading import Lock
+import cv2
+
+DEFAULT_WIDTH = 640
+DEFAULT_HEIGHT = 480
+DEFAULT_FPS = 15
+DEFAULT_BUFFER_SIZE = 1
+# Frames assumed queued when the driver does not report its buffer depth;
+# many V4L2/MSMF backends ignore CAP_PROP_BUFFERSIZE and keep about this many
+FALLBACK_DRIVER_QUEUE = 4
+
+def camera_settings_from_env():
+    settings = {
+        'width': int(os.getenv('FOCUS_CAMERA_WIDTH', DEFAULT_WIDTH)),
+        'height': int(os.getenv('FOCUS_CAMERA_HEIGHT', DEFAULT_HEIGHT)),
+        'fps': float(os.getenv('FOCUS_CAMERA_FPS', DEFAULT_FPS)),
+        'buffer_size': int(os.getenv('FOCUS_CAMERA_BUFFER_SIZE', DEFAULT_BUFFER_SIZE)),
+        'fourcc': os.getenv('FOCUS_CAMERA_FOURCC') or None,
+    }
+    return settings
+
+class CameraSource:
+    """
+    A live camera. read_latest() grabs (without decoding) any frames that
+    queued up in the driver while nobody was reading, then decodes only the
+    newest one. Shared between users through acquire_camera(); release()
+    closes the device when the last user lets go.
+    """
+    def __init__(self, index=0, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, fps=DEFAULT_FPS,
+                 buffer_size=DEFAULT_BUFFER_SIZE, fourcc=None, api_preference=cv2.CAP_ANY):
+        self.index = index
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.buffer_size = buffer_size
+        self.fourcc = fourcc
+        self.api_preference = api_preference
+        self.lock = Lock()
+        self.cap = None
+        self.users = 0
+        self.last_read_time = 0.0
+        self.actual = {}
+
+    def open(self):
+        with self.lock:
+            if self.cap is None:
+                cap = cv2.VideoCapture(self.index, self.api_preference)
+                # FOURCC goes first: some drivers only offer smaller sizes or higher rates in a given format
+                if self.fourcc:
+                    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.fourcc))
+                if self.width and self.height:
+                    cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+                    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+                if self.fps:
+                    cap.set(cv2.CAP_PROP_FPS, self.fps)
+                if self.buffer_size:
+                    cap.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_size)
+                # Drivers may round or ignore requests; keep what was actually applied
+                self.actual = {
+                    'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                    'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                    'fps': cap.get(cv2.CAP_PROP_FPS),
+                    'buffer_size': int(cap.get(cv2.CAP_PROP_BUFFERSIZE)),
+                }
+                self.cap = cap
+            self.users += 1
+        return self
+
+    def is_opened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def driver_queue_depth(self):
+        # What the driver actually applied, not what was requested
+        depth = self.actual.get('buffer_size') or 0
+        return depth if depth > 0 else FALLBACK_DRIVER_QUEUE
+
+    def stale_frames(self, now):
+        # Frames the driver queued since the last read; at most its buffer depth
+        if not self.last_read_time or not self.fps:
+            return 0
+        missed = int((now - self.last_read_time) * self.fps)
+        return min(missed, self.driver_queue_depth())
+
+    def read_latest(self):
+        with self.lock:
+            if self.cap is None:
+                return False, None
+            now = time.monotonic()
+            for _ in range(self.stale_frames(now)):
+                self.cap.grab()
+            if not self.cap.grab():
+                return False, None
+            self.last_read_time = time.monotonic()
+            return self.cap.retrieve()
+
+    def release(self):
+        with self.lock:
+            self.users = max(0, self.users - 1)
+            if self.users == 0 and self.cap is not None:
+                self.cap.release()
+                self.cap = None
+                self.last_read_time = 0.0
+
+class VideoFileSource:
+    """
+    Replays a video file or image sequence through the camera interface.
+    With `realtime`, frames are skipped to follow the file's frame rate like
+    a live camera would; otherwise every frame is returned in order. Reads
+    fail at the end unless `loop` is set.
+    """
+    def __init__(self, path, loop=False, realtime=False):
+        self.path = path
+        self.loop = loop
+        self.realtime = realtime
+        self.cap = None
+        self.start_time = None
+        self.position = 0
+        self.fps = 0.0
+        self.actual = {}
+
+    def open(self):
+        if self.cap is None:
+            self.cap = cv2.VideoCapture(self.path)
+            self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+            self.actual = {
+                'width': int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                'height': int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                'fps': self.fps,
+            }
+            self.start_time = time.monotonic()
+            self.position = 0
+        return self
+
+    def is_opened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def rewind(self):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.start_time = time.monotonic()
+        self.position = 0
+
+    def read_latest(self):
+        if self.cap is None:
+            return False, None
+        if self.realtime:
+            # Skip the frames a live camera would have produced since the last read
+            target = int((time.monotonic() - self.start_time) * self.fps)
+            while self.position < target:
+                if not self.cap.grab():
+                    break
+                self.position += 1
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.rewind()
+            ret, frame = self.cap.read()
+        if ret:
+            self.position += 1
+        return ret, frame
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+# Live cameras by index, so the gaze pipeline and calibration share one device
+_cameras = {}
+_cameras_lock = Lock()
+
+def acquire_camera(index=0, **settings):
+    # Settings apply when the device is first opened; later users share that stream
+    with _cameras_lock:
+        camera = _cameras.get(index)
+        if camera is None:
+            camera = _cameras[index] = CameraSource(index, **settings)
+    return camera.open()
+
+def open_camera_source(source=None, **settings):
+    """
+    Open `source` (a camera index, a video path, or None for FOCUS_CAMERA /
+    camera 0) with `settings` layered over the environment defaults. The
+    result is already open; call release() when done.
+    """
+    if source is None:
+        source = os.getenv('FOCUS_CAMERA', '0')
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    if isinstance(source, int):
+        return acquire_camera(source, **{**camera_settings_from_env(), **settings})
+    return VideoFileSource(source, **settings).open()
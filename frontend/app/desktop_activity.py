@@ -1,110 +1,118 @@
 from threading import Thread, Event, Lock
-import threading
-import queue
 import time
 from datetime import datetime
 import getpass
 import tkinter as tk
 from pynput import keyboard, mouse
 import pygetwindow as gw
-import json
-import cv2
-from gaze_predictor import GazePredictor
+from model_registry import GAZE_MODEL_PATH, ADJUSTMENT_MODEL_PATH, SHAPE_PREDICTOR_PATH
+from event_journal import EventJournal
+from event_store import ColumnarEventBuffer
+from event_uploader import EventUploader
+from api import token_store, start_session, end_session
+from gaze_scheduler import AdaptiveGazeScheduler
+from gaze_filter import make_gaze_filter, FixationDetector
+from input_aggregator import InputAggregator
 
 
 class ActivityMonitor:
-    MOUSE_MOVE_THROTTLE = 0.5
+    MOUSE_SUMMARY_INTERVAL = 5
     ASK_FOCUS_LEVEL_INTERVAL = 30 * 60
     KEYBOARD_SESSION_TIMEOUT = 1
     GAZE_MONITOR_INTERVAL = 0.3
+    GAZE_STATS_INTERVAL = 60
+    GAZE_FILTER = 'one_euro'
+    # Per-frame gaze samples are summarised into fixation events; set to keep the raw points too
+    LOG_RAW_GAZE = False
+    # Refine the calibration mapping from mouse clicks while monitoring
+    ONLINE_RECALIBRATION = True
 
     def __init__(self):
         self.user_id = getpass.getuser()
         self.monitoring_active = Event()
         self.monitoring_active.set()
-        self.event_queue = queue.Queue()
-        self.event_queue_lock = Lock()
-        self.last_mouse_event_time = time.time()
-        self.last_event_time = None
-        self.mouse_start_position = None
-        self.keyboard_activity_buffer = []
-        self.last_keyboard_activity_time = None 
+        self.event_store = ColumnarEventBuffer()
+        self.session_writer = None
         self.window_activity_thread = None
         self.gaze_start_time = None
         self.gaze_start_position = None
-        self.keyboard_session_active = False
-        self.gaze_predictor = GazePredictor(
-            model_path='./models/eye_gaze_v31_20.h5',
-            adjustment_model_path='./models/adjustment_model.pkl',
-            shape_predictor_path='./models/shape_predictor_68_face_landmarks.dat',
+        # Listener callbacks only write into the aggregator's ring buffers
+        self.input_aggregator = InputAggregator(
+            self.log_event,
+            keyboard_session_timeout=self.KEYBOARD_SESSION_TIMEOUT,
+            mouse_summary_interval=self.MOUSE_SUMMARY_INTERVAL,
+            on_click=self.handle_calibration_click,
         )
+        self.online_recalibrator = None
+        self._gaze_predictor = None
+        self.gaze_predictor_lock = Lock()
+        self.models_loading = Event()
+        self.models_ready = Event()
+        self.models_error = None
+        self.event_journal = EventJournal(directory='events_journal')
+        self.event_uploader = EventUploader(source=self.save_events, auth=token_store, session_factory=start_session)
+        self.gaze_scheduler = AdaptiveGazeScheduler(normal_interval=self.GAZE_MONITOR_INTERVAL)
+        self.gaze_filter = make_gaze_filter(self.GAZE_FILTER)
+        self.fixation_detector = FixationDetector()
+        self.active_window_title = None
+
+    @property
+    def gaze_predictor(self):
+        # Importing gaze_predictor pulls in dlib and TensorFlow, so it waits until gaze is needed
+        with self.gaze_predictor_lock:
+            if self._gaze_predictor is None:
+                from gaze_predictor import GazePredictor
+                self._gaze_predictor = GazePredictor(
+                    model_path=GAZE_MODEL_PATH,
+                    adjustment_model_path=ADJUSTMENT_MODEL_PATH,
+                    shape_predictor_path=SHAPE_PREDICTOR_PATH,
+                )
+            return self._gaze_predictor
+
+    def warm_up_models(self):
+        # Load the gaze models in the background so monitoring starts without a stall
+        def warm_up():
+            try:
+                self.gaze_predictor.warm_up()
+                self.models_error = None
+                self.models_ready.set()
+            except Exception as e:
+                print(f"Loading gaze models failed: {e}")
+                self.models_error = str(e)
+            finally:
+                self.models_loading.clear()
+
+        if self.models_ready.is_set() or self.models_loading.is_set():
+            return None
+        self.models_loading.set()
+        thread = Thread(target=warm_up, daemon=True)
+        thread.start()
+        return thread
 
     def log_event(self, event_type, data):
-        current_time = datetime.now()
-        timestamp = current_time.isoformat()
-        event = {
-            "timestamp": timestamp, 
-            "type": event_type, 
-            "data": data, 
-            "time_delta": None  # Initialize time_delta with None
-        }
-        with self.event_queue_lock:
-            if self.last_event_time is not None:
-                event['time_delta'] = (current_time - self.last_event_time).total_seconds()
-            self.last_event_time = current_time  # Update the last event time
-            self.event_queue.put(event)
+        self.event_store.append(event_type, data)
 
     def on_press(self, key):
         if not self.monitoring_active.is_set():
             return False
-        current_time = time.time()
-        if not self.keyboard_activity_buffer or current_time - self.last_keyboard_activity_time > self.KEYBOARD_SESSION_TIMEOUT:
-            # If a new session or previous session has ended, log the old session if it exists
-            if self.keyboard_activity_buffer:
-                self.end_keyboard_session()
-            self.keyboard_activity_buffer = [{"timestamp": datetime.now().isoformat(), "key": str(key)}]
-        else:
-            # Within the same session, append the key press
-            self.keyboard_activity_buffer.append({"timestamp": datetime.now().isoformat(), "key": str(key)})
-        self.last_keyboard_activity_time = current_time
-        self.keyboard_session_active = True
-        # Cancel existing timer if one is already set
-        if hasattr(self, 'keyboard_session_timer'):
-            self.keyboard_session_timer.cancel()
-        # Set a new timer to end the session after the timeout period
-        self.keyboard_session_timer = threading.Timer(self.KEYBOARD_SESSION_TIMEOUT, self.end_keyboard_session)
-        self.keyboard_session_timer.start()
-
-    def end_keyboard_session(self):
-        if self.keyboard_activity_buffer:
-            # Log the session
-            self.log_event('keyboard_session', {
-                'start_time': self.keyboard_activity_buffer[0]["timestamp"],
-                'end_time': self.keyboard_activity_buffer[-1]["timestamp"],
-                'key_strokes': len(self.keyboard_activity_buffer)
-            })
-            self.keyboard_activity_buffer = []  # Clear the session buffer
-        self.keyboard_session_active = False  # Indicate the session has ended
+        self.gaze_scheduler.note_input()
+        self.input_aggregator.record_key()
+
+    @property
+    def keyboard_session_active(self):
+        return self.input_aggregator.keyboard_session_active
 
     def on_click(self, x, y, button, pressed):
         if not self.monitoring_active.is_set():
             return False
-        if pressed:
-            self.log_event('mouse_click', {'position': (x, y), 'button': str(button)})
-            self.mouse_start_position = (x, y)
-        else:
-            if self.mouse_start_position:
-                self.log_event('mouse_movement', {'start_position': self.mouse_start_position, 'end_position': (x, y)})
-                self.mouse_start_position = None
+        self.gaze_scheduler.note_input()
+        self.input_aggregator.record_click(x, y, button, pressed)
 
     def on_move(self, x, y):
         if not self.monitoring_active.is_set():
             return False
-        current_time = time.time()
-        if current_time - self.last_mouse_event_time >= self.MOUSE_MOVE_THROTTLE:
-            if not self.mouse_start_position:
-                self.mouse_start_position = (x, y)
-            self.last_mouse_event_time = current_time
+        self.gaze_scheduler.note_input()
+        self.input_aggregator.record_move(x, y)
 
     def log_active_window_periodically(self):
         last_active_window_title = None
@@ -112,30 +120,65 @@ class ActivityMonitor:
             active_window_title = gw.getActiveWindow().title if gw.getActiveWindow() else None
             if active_window_title and active_window_title != last_active_window_title:
                 self.log_event("active_window", {"title": active_window_title})
+                self.active_window_title = active_window_title
                 last_active_window_title = active_window_title
             time.sleep(2)
 
     def monitor_gaze(self):
-        cap = cv2.VideoCapture(0)
-        while self.monitoring_active.is_set():
-            ret, frame = cap.read()
-            if not ret:
-                break
+        from gaze_pipeline import GazePipeline
+        if self.ONLINE_RECALIBRATION and self.online_recalibrator is None:
+            from online_calibration import OnlineRecalibrator
+            self.online_recalibrator = OnlineRecalibrator(
+                (self.gaze_predictor.screen_width, self.gaze_predictor.screen_height),
+                mapper_path=self.gaze_predictor.adjustment_model_path,
+            )
+        self.gaze_pipeline = GazePipeline(self.gaze_predictor, on_result=self.handle_gaze_result, scheduler=self.gaze_scheduler)
+        self.gaze_pipeline.start()
+        last_stats_time = time.time()
+        while self.monitoring_active.is_set() and self.gaze_pipeline.running.is_set():
+            time.sleep(0.5)
+            if time.time() - last_stats_time >= self.GAZE_STATS_INTERVAL:
+                # Record the effective sampling rate and CPU cost alongside the activity data
+                self.log_event("gaze_sampling", self.gaze_scheduler.get_stats())
+                if self.online_recalibrator:
+                    self.log_event("online_calibration", self.online_recalibrator.get_stats())
+                last_stats_time = time.time()
+        self.gaze_pipeline.stop()
+        self.log_fixation(self.fixation_detector.flush())
 
-            gaze_x, gaze_y, adjusted_x, adjusted_y = self.gaze_predictor.predict_gaze(frame)
-            if gaze_x is not None:
-                self.gaze_start_position = (adjusted_x, adjusted_y)
+    def handle_gaze_result(self, result):
+        gaze_x, gaze_y = result["gaze"]
+        adjusted_x, adjusted_y = result["adjusted_gaze"]
+        if gaze_x is not None:
+            self.gaze_start_position = (adjusted_x, adjusted_y)
+            screen_width, screen_height = self.gaze_predictor.screen_width, self.gaze_predictor.screen_height
+            self.gaze_scheduler.record_gaze(0 <= adjusted_x < screen_width and 0 <= adjusted_y < screen_height)
 
-                log_data = {
-                    "gaze_start_position": (gaze_x, gaze_y),
-                    "adjusted_gaze_start_position": (adjusted_x, adjusted_y)
-                }
-                self.log_event("gaze_data", log_data)
+            if self.LOG_RAW_GAZE:
+                self.event_store.append_gaze(gaze_x, gaze_y, adjusted_x, adjusted_y, result["latency"] * 1000)
+            if self.online_recalibrator:
+                # Raw model output, normalised, for pairing with clicks on the aggregator thread
+                self.online_recalibrator.record_prediction(
+                    time.monotonic() - result["latency"], gaze_x / screen_width, gaze_y / screen_height)
+            # Wall-clock time the frame was captured, not when inference finished
+            timestamp = time.time() - result["latency"]
+            x, y = self.gaze_filter.update(timestamp, adjusted_x, adjusted_y)
+            self.log_fixation(self.fixation_detector.add(timestamp, x, y, self.gaze_scheduler.interval()))
 
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+    def handle_calibration_click(self, x, y, timestamp):
+        # Runs on the input aggregator's worker thread, never on a listener or the gaze loop
+        if self.online_recalibrator:
+            self.online_recalibrator.add_click(x, y, timestamp)
 
-        cap.release()
+    def log_fixation(self, fixation):
+        if fixation is None:
+            return
+        x, y = fixation["centroid"]
+        screen_width, screen_height = self.gaze_predictor.screen_width, self.gaze_predictor.screen_height
+        fixation["on_screen"] = 0 <= x < screen_width and 0 <= y < screen_height
+        fixation["screen_size"] = (screen_width, screen_height)
+        fixation["window"] = self.active_window_title
+        self.log_event("fixation", fixation)
 
     def ask_focus_level(self):
         while self.monitoring_active.is_set():
@@ -160,40 +203,29 @@ class ActivityMonitor:
 
             root.mainloop()
 
-    def save_events_to_json(self, file_path="events_data.json"):
-        event_batch = []
-        with self.event_queue_lock:
-            while not self.event_queue.empty():
-                event = self.event_queue.get_nowait()
-                event_batch.append(event)
-                self.event_queue.task_done()
-        
-        if event_batch:
-            existing_data = []
-            # Check if the file already exists and has data
-            try:
-                with open(file_path, "r") as file:
-                    existing_data = json.load(file)
-            except (FileNotFoundError, json.JSONDecodeError):
-                # If the file doesn't exist or is empty/corrupted, we start with an empty list
-                existing_data = []
-
-            # Append new events to the existing data
-            updated_data = existing_data + event_batch
+    def save_events(self):
+        # Swapping out the columns is constant time; records are only built for the JSON writers
+        columns = self.event_store.drain()
+        if self.session_writer is not None:
+            self.session_writer.append(columns)
+        event_batch = columns.to_records()
 
-            # Write the combined data back to the file
-            with open(file_path, "w") as file:
-                json.dump(updated_data, file, indent=4)
+        # Only the new batch is written; history on disk is never re-read
+        self.event_journal.append(event_batch)
+        return event_batch
 
-
-    def periodic_data_saving(self, interval=600, file_path="events_data.json"):
+    def periodic_data_saving(self, interval=600):
         while self.monitoring_active.is_set():
             time.sleep(interval)
-            self.save_events_to_json(file_path)
-
-
+            self.save_events()
 
     def start_monitoring(self):
+        from session_format import SessionWriter
+        if self.session_writer is not None:
+            return
+        self.monitoring_active.set()
+        self.session_writer = SessionWriter(f"sessions/{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        self.input_aggregator.start()
         self.keyboard_listener = keyboard.Listener(on_press=self.on_press)
         self.mouse_listener = mouse.Listener(on_click=self.on_click, on_move=self.on_move)
         
@@ -209,7 +241,26 @@ class ActivityMonitor:
         self.gaze_monitoring_thread = Thread(target=self.monitor_gaze, daemon=True)
         self.gaze_monitoring_thread.start()
 
+        # The uploader drains the event store, journals each batch and ships it
+        self.event_uploader.start()
+
     def stop_monitoring(self):
+        # Safe to call when monitoring never started (e.g. logging out right after login)
+        if self.session_writer is None:
+            return
         self.monitoring_active.clear()
         self.keyboard_listener.stop()
-        self.mouse_listener.stop()
\ No newline at end of file
+        self.mouse_listener.stop()
+        self.input_aggregator.stop()
+        self.event_uploader.stop()
+        # Spooled batches belong to this user's session: try to deliver them before the
+        # session ends, since another user's token could never write to it
+        self.event_uploader.upload_spool()
+        if self.event_uploader.session_id is not None:
+            end_session(self.event_uploader.session_id)
+            self.event_uploader.session_id = None
+        self.event_journal.close()
+        if self.online_recalibrator:
+            self.online_recalibrator.save()
+        self.session_writer.close()
+        self.session_writer = None
\ No newline at end of file
@@ -0,0 +1,127 @@
+import os
+import gzip
+import json
+import shutil
+import time
+from datetime import datetime
+from threading import Lock
+
+class EventJournal:
+    """
+    Append-only, line-delimited (NDJSON) event journal split into segments.
+
+    Each save only writes the new batch, so its cost does not grow with the
+    session history. A segment is closed once it reaches max_segment_bytes or
+    max_segment_age seconds; closed segments are optionally gzip-compressed.
+    """
+    SEGMENT_PREFIX = "events-"
+    SEGMENT_SUFFIX = ".ndjson"
+
+    def __init__(self, directory="events_journal", max_segment_bytes=16 * 1024 * 1024,
+                 max_segment_age=60 * 60, compress_closed=True, fsync=False):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        self.compress_closed = compress_closed
+        self.fsync = fsync
+        self.lock = Lock()
+        self.segment_file = None
+        self.segment_path = None
+        self.segment_opened_at = None
+        self.segment_sequence = 0
+        os.makedirs(self.directory, exist_ok=True)
+        if self.compress_closed:
+            # Segments left open by a previous run are closed by definition
+            for path in self.segment_paths():
+                if path.endswith(self.SEGMENT_SUFFIX):
+                    self.compress_segment(path)
+
+    def new_segment_path(self):
+        self.segment_sequence += 1
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        name = f"{self.SEGMENT_PREFIX}{stamp}-{os.getpid()}-{self.segment_sequence:04d}{self.SEGMENT_SUFFIX}"
+        return os.path.join(self.directory, name)
+
+    def open_segment(self):
+        self.segment_path = self.new_segment_path()
+        self.segment_file = open(self.segment_path, "a", encoding="utf-8")
+        self.segment_opened_at = time.time()
+
+    def close_segment(self):
+        if self.segment_file is None:
+            return
+        self.segment_file.close()
+        closed_path = self.segment_path
+        self.segment_file = None
+        self.segment_path = None
+        if self.compress_closed:
+            self.compress_segment(closed_path)
+
+    def compress_segment(self, path):
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+        with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+
+    def should_rotate(self):
+        if self.segment_file is None:
+            return False
+        if self.segment_file.tell() >= self.max_segment_bytes:
+            return True
+        return time.time() - self.segment_opened_at >= self.max_segment_age
+
+    def append(self, events):
+        """Append a batch of events, one JSON document per line."""
+        if not events:
+            return 0
+        lines = "".join(json.dumps(event, separators=(",", ":")) + "\n" for event in events)
+        with self.lock:
+            if self.should_rotate():
+                self.close_segment()
+            if self.segment_file is None:
+                self.open_segment()
+            self.segment_file.write(lines)
+            self.segment_file.flush()
+            if self.fsync:
+                os.fsync(self.segment_file.fileno())
+        return len(events)
+
+    def close(self):
+        with self.lock:
+            self.close_segment()
+
+    def segment_paths(self):
+        names = [
+            name for name in os.listdir(self.directory)
+            if name.startswith(self.SEGMENT_PREFIX)
+            and (name.endswith(self.SEGMENT_SUFFIX) or name.endswith(self.SEGMENT_SUFFIX + ".gz"))
+        ]
+        return [os.path.join(self.directory, name) for name in sorted(names)]
+
+    def read_events(self):
+        """Stream every journalled event in order without loading whole segments."""
+        for path in self.segment_paths():
+            yield from read_segment(path)
+
+def read_segment(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-write can leave a truncated last line; skip it
+                continue
+
+def import_legacy_json(journal, file_path="events_data.json"):
+    # One-off migration of the old pretty-printed JSON array into the journal
+    try:
+        with open(file_path, "r") as file:
+            events = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return 0
+    return journal.append(events)
@@ -0,0 +1,125 @@
+import time
+from array import array
+from datetime import datetime
+from threading import Lock
+
+GAZE_EVENT = 'gaze_data'
+KNOWN_EVENT_TYPES = (
+    GAZE_EVENT, 'keyboard_session', 'mouse_click', 'mouse_movement', 'mouse_summary',
+    'active_window', 'focus_level', 'gaze_sampling', 'fixation',
+    'online_calibration',
+)
+
+def new_columns():
+    return {
+        'timestamp': array('d'),       # Unix time, float64
+        'type_code': array('B'),       # Index into the buffer's event type names
+        'gaze_x': array('i'),
+        'gaze_y': array('i'),
+        'adjusted_x': array('i'),
+        'adjusted_y': array('i'),
+        'latency_ms': array('f'),
+        'payload_index': array('i'),   # Row in `payloads`, -1 for gaze samples
+    }
+
+class EventBatch:
+    """Events drained from a ColumnarEventBuffer, still in column form."""
+    def __init__(self, columns, payloads, type_names, previous_timestamp):
+        self.columns = columns
+        self.payloads = payloads
+        self.type_names = type_names
+        self.previous_timestamp = previous_timestamp
+
+    def __len__(self):
+        return len(self.columns['timestamp'])
+
+    def to_records(self):
+        # Materialise the original dict-per-event format for JSON writers and the uploader
+        c = self.columns
+        records = []
+        previous = self.previous_timestamp
+        for i in range(len(self)):
+            timestamp = c['timestamp'][i]
+            payload_index = c['payload_index'][i]
+            if payload_index >= 0:
+                data = self.payloads[payload_index]
+            else:
+                data = {
+                    "gaze_start_position": (c['gaze_x'][i], c['gaze_y'][i]),
+                    "adjusted_gaze_start_position": (c['adjusted_x'][i], c['adjusted_y'][i]),
+                    "latency_ms": round(c['latency_ms'][i], 1),
+                }
+            records.append({
+                "timestamp": datetime.fromtimestamp(timestamp).isoformat(),
+                "type": self.type_names[c['type_code'][i]],
+                "data": data,
+                "time_delta": timestamp - previous if previous is not None else None,
+            })
+            previous = timestamp
+        return records
+
+class ColumnarEventBuffer:
+    """
+    Array-backed replacement for a queue of event dicts.
+
+    Gaze samples, by far the most frequent event, are stored as a handful of
+    typed numbers (33 bytes) instead of a nested dict with an ISO string.
+    Rare events keep their data dict in a side list. Draining swaps the
+    columns out under the lock, so a flush is a constant-time hand-off.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.type_names = list(KNOWN_EVENT_TYPES)
+        self.type_codes = {name: code for code, name in enumerate(self.type_names)}
+        self.columns = new_columns()
+        self.payloads = []
+        self.last_drained_timestamp = None
+
+    def __len__(self):
+        return len(self.columns['timestamp'])
+
+    def type_code(self, event_type):
+        code = self.type_codes.get(event_type)
+        if code is None:
+            code = self.type_codes[event_type] = len(self.type_names)
+            self.type_names.append(event_type)
+        return code
+
+    def append(self, event_type, data, timestamp=None):
+        with self.lock:
+            c = self.columns
+            c['timestamp'].append(timestamp or time.time())
+            c['type_code'].append(self.type_code(event_type))
+            c['gaze_x'].append(0)
+            c['gaze_y'].append(0)
+            c['adjusted_x'].append(0)
+            c['adjusted_y'].append(0)
+            c['latency_ms'].append(0.0)
+            c['payload_index'].append(len(self.payloads))
+            self.payloads.append(data)
+
+    def append_gaze(self, gaze_x, gaze_y, adjusted_x, adjusted_y, latency_ms=0.0, timestamp=None):
+        with self.lock:
+            c = self.columns
+            c['timestamp'].append(timestamp or time.time())
+            c['type_code'].append(self.type_codes[GAZE_EVENT])
+            c['gaze_x'].append(gaze_x)
+            c['gaze_y'].append(gaze_y)
+            c['adjusted_x'].append(adjusted_x)
+            c['adjusted_y'].append(adjusted_y)
+            c['latency_ms'].append(latency_ms)
+            c['payload_index'].append(-1)
+
+    def drain(self):
+        with self.lock:
+            batch = EventBatch(self.columns, self.payloads, list(self.type_names), self.last_drained_timestamp)
+            if len(batch):
+                self.last_drained_timestamp = batch.columns['timestamp'][-1]
+            self.columns = new_columns()
+            self.payloads = []
+        return batch
+
+    def memory_usage(self):
+        # Bytes held by the numeric columns (payload dicts not included)
+        with self.lock:
+            return sum(column.itemsize * len(column) for column in self.columns.values())
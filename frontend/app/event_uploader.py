@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import random
+from datetime import datetime, timezone
+from threading import Thread, Event, Lock
+import requests
+from requests.adapters import HTTPAdapter
+from api import API_URL
+
+def to_utc_isoformat(timestamp):
+    # Events are stamped in naive local time; the backend stores naive values as UTC
+    parsed = datetime.fromisoformat(timestamp)
+    if parsed.tzinfo is None:
+        parsed = parsed.astimezone()  # Interpreted as local time
+    return parsed.astimezone(timezone.utc).isoformat()
+
+class EventUploader:
+    """
+    Ships monitored events to the backend's /activity-log/batch endpoint.
+
+    A single daemon thread pulls events from `source` (a callable returning a
+    list of newly logged events), batches them by size and age and posts them
+    as NDJSON over a pooled keep-alive session. When the server can't be
+    reached, batches are spooled to disk and retried with exponential backoff,
+    so the pynput listeners and the Tk mainloop are never blocked.
+
+    `auth` (an api.TokenStore) supplies the bearer token and is refreshed on
+    401. When `session_id` is None, `session_factory` is called from the
+    upload thread to create the backend Session the events belong to.
+    """
+    def __init__(self, source, session_id=None, url=f"{API_URL}/activity-log/batch",
+                 batch_size=500, max_batch_age=5.0, poll_interval=1.0,
+                 spool_dir="upload_spool", max_spool_bytes=64 * 1024 * 1024,
+                 request_timeout=10, max_backoff=300, auth=None, session_factory=None):
+        self.source = source
+        self.session_id = session_id
+        self.auth = auth
+        self.session_factory = session_factory
+        self.url = url
+        self.batch_size = batch_size
+        self.max_batch_age = max_batch_age
+        self.poll_interval = poll_interval
+        self.spool_dir = spool_dir
+        self.max_spool_bytes = max_spool_bytes
+        self.request_timeout = request_timeout
+        self.max_backoff = max_backoff
+        self.headers = {}
+
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+
+        self.pending = []
+        self.pending_since = None
+        self.backoff = 0
+        self.next_attempt_time = 0
+        self.stats_lock = Lock()
+        self.stats = {"queued": 0, "sent": 0, "rejected": 0, "spooled": 0, "dropped": 0, "failed_requests": 0}
+        self.stop_event = Event()
+        self.thread = None
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+    def count(self, name, value):
+        with self.stats_lock:
+            self.stats[name] += value
+
+    def get_stats(self):
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats["pending"] = len(self.pending)
+        stats["spool_files"] = len(self.spool_paths())
+        return stats
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=5):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                # Still inside send(): `pending` belongs to the worker, which spools it on exit
+                return
+        self.drain()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.collect()
+            if time.time() >= self.next_attempt_time:
+                self.flush_spool()
+                if self.batch_ready():
+                    batch = self.take_batch()
+                    if not self.send(batch):
+                        self.spool(batch)
+            self.stop_event.wait(self.poll_interval)
+        self.drain()
+
+    def drain(self):
+        # Anything not delivered yet is kept on disk for the next run
+        self.collect()
+        if self.pending:
+            self.spool(self.pending)
+            self.pending = []
+
+    def collect(self):
+        events = self.source()
+        if events:
+            if not self.pending:
+                self.pending_since = time.time()
+            self.pending.extend(self.to_payload(event) for event in events)
+            self.count("queued", len(events))
+
+    def to_payload(self, event):
+        data = dict(event.get("data") or {})
+        if event.get("time_delta") is not None:
+            data["time_delta"] = event["time_delta"]
+        return {
+            "session_id": self.session_id,
+            "event_type": event["type"],
+            "timestamp": to_utc_isoformat(event["timestamp"]),
+            "data": data,
+        }
+
+    def batch_ready(self):
+        if not self.pending:
+            return False
+        if len(self.pending) >= self.batch_size:
+            return True
+        return time.time() - self.pending_since >= self.max_batch_age
+
+    def take_batch(self):
+        batch = self.pending[:self.batch_size]
+        self.pending = self.pending[self.batch_size:]
+        self.pending_since = time.time() if self.pending else None
+        return batch
+
+    def send(self, batch):
+        # Returns True once the server has taken responsibility for the batch
+        if self.session_id is None and self.session_factory is not None:
+            self.session_id = self.session_factory()
+            if self.session_id is None:
+                self.schedule_retry()
+        if self.session_id is None:
+            return False
+        for item in batch:
+            if item["session_id"] is None:
+                item["session_id"] = self.session_id
+            # Batches spooled by older versions still carry naive local timestamps
+            item["timestamp"] = to_utc_isoformat(item["timestamp"])
+        body = "".join(json.dumps(item, separators=(",", ":")) + "\n" for item in batch)
+        headers = {"Content-Type": "application/x-ndjson", **self.headers}
+        if self.auth is not None:
+            headers.update(self.auth.headers())
+        try:
+            response = self.http.post(self.url, data=body.encode("utf-8"), headers=headers, timeout=self.request_timeout)
+        except requests.RequestException as e:
+            print(f"Event upload failed: {e}")
+            self.schedule_retry()
+            return False
+
+        if response.status_code in (201, 207):
+            result = response.json()
+            self.count("sent", result.get("accepted", 0))
+            self.count("rejected", result.get("rejected", 0))
+            self.backoff = 0
+            return True
+        if response.status_code == 401 and self.auth is not None and self.auth.refresh():
+            # Access token expired; the next attempt goes out with the new one
+            return False
+        if 400 <= response.status_code < 500 and response.status_code not in (401, 408, 429):
+            # The server will never accept this batch; retrying would only block the spool
+            print(f"Event batch rejected with status {response.status_code}")
+            self.count("dropped", len(batch))
+            return True
+        self.schedule_retry()
+        return False
+
+    def schedule_retry(self):
+        self.count("failed_requests", 1)
+        self.backoff = min(self.max_backoff, max(1, self.backoff * 2))
+        self.next_attempt_time = time.time() + self.backoff * random.uniform(0.5, 1.0)
+
+    def spool_paths(self):
+        names = sorted(name for name in os.listdir(self.spool_dir) if name.endswith(".ndjson"))
+        return [os.path.join(self.spool_dir, name) for name in names]
+
+    def spool_size(self):
+        return sum(os.path.getsize(path) for path in self.spool_paths())
+
+    def spool(self, batch):
+        body = "".join(json.dumps(item, separators=(",", ":")) + "\n" for item in batch)
+        if self.spool_size() + len(body) > self.max_spool_bytes:
+            print("Upload spool is full, dropping event batch")
+            self.count("dropped", len(batch))
+            return
+        name = f"{time.time_ns()}.ndjson"
+        tmp_path = os.path.join(self.spool_dir, name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(body)
+        os.replace(tmp_path, os.path.join(self.spool_dir, name))
+        self.count("spooled", len(batch))
+
+    def upload_spool(self):
+        # A last delivery attempt after stop(), e.g. on logout while the user's token is
+        # still valid; left to the worker if it is still finishing a request
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.flush_spool(force=True)
+
+    def flush_spool(self, force=False):
+        # Oldest spooled batches go first so the server sees events in order
+        for path in self.spool_paths():
+            if self.stop_event.is_set() and not force:
+                return
+            with open(path, "r", encoding="utf-8") as f:
+                batch = [json.loads(line) for line in f if line.strip()]
+            if not self.send(batch):
+                return
+            os.remove(path)
@@ -0,0 +1,74 @@
+from itertools import chain
+import numpy as np
+import cv2
+
+# Landmarks bounding the combined eye crop: eyes, nose bridge, eyebrows/forehead and temples
+LEFT_EYE_POINTS = (36, 37, 38, 39, 40, 41)
+RIGHT_EYE_POINTS = (42, 43, 44, 45, 46, 47)
+NOSE_BRIDGE_POINTS = (27, 28, 29)
+FOREHEAD_POINTS = (20, 21, 22, 23, 0, 16)
+EYE_REGION_POINTS = LEFT_EYE_POINTS + RIGHT_EYE_POINTS + NOSE_BRIDGE_POINTS + FOREHEAD_POINTS
+EYE_REGION_INDEX = np.array(EYE_REGION_POINTS)
+
+def landmarks_to_array(landmarks, out=None):
+    """
+    All dlib landmark coordinates as an (n, 2) int32 array. dlib exposes no
+    buffer for its points, so they are read in one fromiter pass; subsets are
+    then taken from the array with a single fancy index.
+    """
+    parts = landmarks.parts()
+    coords = np.fromiter(chain.from_iterable((p.x, p.y) for p in parts), dtype=np.int32, count=2 * len(parts))
+    if out is None:
+        return coords.reshape(-1, 2)
+    out.reshape(-1)[:] = coords
+    return out
+
+class EyeCropper:
+    """
+    Shared preprocessing for the gaze model: grayscale conversion, eye-region
+    crop, resize and [0, 1] normalisation.
+
+    All intermediate images live in buffers that are allocated once and reused
+    for every frame. The returned crop is a view of the cropper's output buffer
+    and is overwritten by the next call; pass `out` (e.g. a slot of a batch
+    array) to normalise straight into caller-owned memory instead. Landmarks
+    may be a dlib shape or an (68, 2) array already converted by the caller.
+    """
+    def __init__(self, target_size=(200, 100), channels=3):
+        self.target_size = target_size
+        width, height = target_size
+        self.landmarks = np.empty((68, 2), dtype=np.int32)
+        self.points = np.empty((len(EYE_REGION_POINTS), 2), dtype=np.int32)
+        self.gray_buffer = None
+        self.resized = np.empty((height, width, channels), dtype=np.uint8)
+        self.output = np.empty((height, width, channels), dtype=np.float32)
+
+    def gray(self, frame):
+        if self.gray_buffer is None or self.gray_buffer.shape != frame.shape[:2]:
+            self.gray_buffer = np.empty(frame.shape[:2], dtype=np.uint8)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray_buffer)
+
+    def eye_region_box(self, landmarks, frame_shape):
+        if not isinstance(landmarks, np.ndarray):
+            landmarks = landmarks_to_array(landmarks, out=self.landmarks)
+        points = np.take(landmarks, EYE_REGION_INDEX, axis=0, out=self.points)
+        min_x, min_y = points.min(axis=0)
+        max_x, max_y = points.max(axis=0)
+        height, width = frame_shape[:2]
+        return max(0, int(min_x)), max(0, int(min_y)), min(width, int(max_x)), min(height, int(max_y))
+
+    def extract_eye_region(self, frame, landmarks):
+        min_x, min_y, max_x, max_y = self.eye_region_box(landmarks, frame.shape)
+        # Slicing is a view into the frame, no pixels are copied here
+        return frame[min_y:max_y, min_x:max_x], (min_x, min_y, max_x, max_y)
+
+    def crop(self, frame, landmarks, out=None):
+        """Returns the normalised float32 eye crop, or None if the region is empty."""
+        region, _ = self.extract_eye_region(frame, landmarks)
+        if region.size == 0:
+            return None
+        if out is None:
+            out = self.output
+        cv2.resize(region, self.target_size, dst=self.resized, interpolation=cv2.INTER_AREA)
+        np.divide(self.resized, np.float32(255.0), out=out)
+        return out
@@ -0,0 +1,207 @@
+import math
+from collections import deque
+from datetime import datetime
+
+class MovingAverageFilter:
+    """Mean of the last `window` points, kept as running sums so each update is O(1)."""
+    def __init__(self, window=5):
+        self.points = deque(maxlen=window)
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+
+    def reset(self):
+        self.points.clear()
+        self.sum_x = self.sum_y = 0.0
+
+    def update(self, timestamp, x, y):
+        if len(self.points) == self.points.maxlen:
+            old_x, old_y = self.points[0]
+            self.sum_x -= old_x
+            self.sum_y -= old_y
+        self.points.append((x, y))
+        self.sum_x += x
+        self.sum_y += y
+        return self.sum_x / len(self.points), self.sum_y / len(self.points)
+
+class OneEuroFilter:
+    """
+    One Euro filter (Casiez et al., 2012): a low-pass filter whose cutoff
+    rises with speed, so fixations are smoothed hard while saccades pass
+    through with little lag. `min_cutoff` (Hz) sets jitter removal at rest,
+    `beta` how quickly the cutoff opens up with speed (pixels/s).
+    """
+    def __init__(self, min_cutoff=1.0, beta=0.01, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self.last_time = None
+        self.value = None
+        self.derivative = (0.0, 0.0)
+
+    @staticmethod
+    def alpha(cutoff, dt):
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def update(self, timestamp, x, y):
+        if self.value is None:
+            self.last_time = timestamp
+            self.value = (x, y)
+            return self.value
+        dt = max(timestamp - self.last_time, 1e-3)
+        self.last_time = timestamp
+        prev_x, prev_y = self.value
+
+        a_d = self.alpha(self.d_cutoff, dt)
+        dx = a_d * (x - prev_x) / dt + (1 - a_d) * self.derivative[0]
+        dy = a_d * (y - prev_y) / dt + (1 - a_d) * self.derivative[1]
+        self.derivative = (dx, dy)
+
+        a = self.alpha(self.min_cutoff + self.beta * math.hypot(dx, dy), dt)
+        self.value = (a * x + (1 - a) * prev_x, a * y + (1 - a) * prev_y)
+        return self.value
+
+class KalmanFilter:
+    """
+    Per-axis constant-position Kalman filter. `process_noise` is how far the
+    gaze is expected to wander per second (pixels^2/s), `measurement_noise`
+    the variance of a single prediction (pixels^2).
+    """
+    def __init__(self, process_noise=2000.0, measurement_noise=1500.0):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.reset()
+
+    def reset(self):
+        self.last_time = None
+        self.value = None
+        self.variance = 0.0
+
+    def update(self, timestamp, x, y):
+        if self.value is None:
+            self.last_time = timestamp
+            self.value = (x, y)
+            self.variance = self.measurement_noise
+            return self.value
+        dt = max(timestamp - self.last_time, 1e-3)
+        self.last_time = timestamp
+        # Both axes share the same noise model, so one variance and gain serve both
+        variance = self.variance + self.process_noise * dt
+        gain = variance / (variance + self.measurement_noise)
+        self.variance = (1 - gain) * variance
+        self.value = (self.value[0] + gain * (x - self.value[0]), self.value[1] + gain * (y - self.value[1]))
+        return self.value
+
+class PassThroughFilter:
+    def reset(self):
+        pass
+
+    def update(self, timestamp, x, y):
+        return x, y
+
+GAZE_FILTERS = {
+    'none': PassThroughFilter,
+    'moving_average': MovingAverageFilter,
+    'one_euro': OneEuroFilter,
+    'kalman': KalmanFilter,
+}
+
+def make_gaze_filter(kind='one_euro', **kwargs):
+    try:
+        return GAZE_FILTERS[kind](**kwargs)
+    except KeyError:
+        raise ValueError(f"Unknown gaze filter {kind!r}, expected one of {', '.join(GAZE_FILTERS)}") from None
+
+class FixationDetector:
+    """
+    Online dispersion-threshold (I-DT) fixation classifier.
+
+    Samples are added to the current window while its bounding box stays
+    within `max_dispersion` pixels (width + height). When a sample breaks
+    out, the window is reported as a fixation if it lasted `min_duration`
+    seconds; otherwise it was part of a saccade and is discarded. Windows
+    only ever grow or restart, so the bounds and centroid are running values.
+    Fixations longer than `max_duration` are reported in pieces so a long
+    stare still shows up before the session ends. A pause between samples
+    longer than `max_gap`, or `gap_factor` sampling intervals when the
+    caller passes the current one, ends the window.
+    """
+    def __init__(self, max_dispersion=100, min_duration=0.1, max_duration=10.0, max_gap=1.0, gap_factor=2.5):
+        self.max_dispersion = max_dispersion
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.max_gap = max_gap
+        self.gap_factor = gap_factor
+        self.last_centroid = None
+        self.saccades = 0
+        self.start_window(None, 0, 0)
+
+    def start_window(self, timestamp, x, y):
+        self.start_time = timestamp
+        self.end_time = timestamp
+        self.count = 0 if timestamp is None else 1
+        self.sum_x, self.sum_y = x, y
+        self.min_x = self.max_x = x
+        self.min_y = self.max_y = y
+
+    def add(self, timestamp, x, y, interval=None):
+        # Returns a finished fixation dict, or None. `interval` is the expected time between
+        # samples; slow (idle, battery) sampling must not look like a lost face
+        if self.count == 0:
+            self.start_window(timestamp, x, y)
+            return None
+        max_gap = self.max_gap if interval is None else max(self.max_gap, self.gap_factor * interval)
+        if timestamp - self.end_time > max_gap:
+            # Face lost or sampling paused: don't bridge fixations across the gap
+            fixation = self.finish()
+            self.start_window(timestamp, x, y)
+            return fixation
+
+        min_x, max_x = min(self.min_x, x), max(self.max_x, x)
+        min_y, max_y = min(self.min_y, y), max(self.max_y, y)
+        if (max_x - min_x) + (max_y - min_y) > self.max_dispersion:
+            fixation = self.finish()
+            if fixation is None:
+                self.saccades += 1
+            self.start_window(timestamp, x, y)
+            return fixation
+
+        self.min_x, self.max_x, self.min_y, self.max_y = min_x, max_x, min_y, max_y
+        self.sum_x += x
+        self.sum_y += y
+        self.count += 1
+        self.end_time = timestamp
+        if self.end_time - self.start_time >= self.max_duration:
+            fixation = self.finish()
+            self.count = 0
+            return fixation
+        return None
+
+    def finish(self):
+        # Report the current window if it qualifies as a fixation
+        if self.count == 0 or self.end_time - self.start_time < self.min_duration:
+            return None
+        centroid = (round(self.sum_x / self.count), round(self.sum_y / self.count))
+        amplitude = None
+        if self.last_centroid is not None:
+            amplitude = round(math.hypot(centroid[0] - self.last_centroid[0], centroid[1] - self.last_centroid[1]))
+        fixation = {
+            "start": datetime.fromtimestamp(self.start_time).isoformat(),
+            "duration": round(self.end_time - self.start_time, 3),
+            "centroid": centroid,
+            "dispersion": round((self.max_x - self.min_x) + (self.max_y - self.min_y)),
+            "samples": self.count,
+            "saccade_amplitude": amplitude,
+            "saccades_before": self.saccades,
+        }
+        self.last_centroid = centroid
+        self.saccades = 0
+        return fixation
+
+    def flush(self):
+        fixation = self.finish()
+        self.count = 0
+        return fixation
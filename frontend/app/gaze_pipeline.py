@@ -0,0 +1,208 @@
+import time
+import queue
+from collections import deque
+from threading import Thread, Event, Condition
+import numpy as np
+from camera_source import open_camera_source, CameraSource
+
+def put_drop_oldest(q, item, on_drop=None):
+    # Bounded hand-off between stages: a slow consumer sees the newest work, never a backlog
+    dropped = 0
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                old = q.get_nowait()
+                dropped += 1
+                if on_drop:
+                    on_drop(old)
+            except queue.Empty:
+                pass
+
+class LatestFrame:
+    """Single-slot frame holder; writing replaces whatever hasn't been consumed yet."""
+    def __init__(self):
+        self.condition = Condition()
+        self.frame = None
+        self.capture_time = None
+        self.sequence = 0
+
+    def put(self, frame, capture_time):
+        with self.condition:
+            self.frame = frame
+            self.capture_time = capture_time
+            self.sequence += 1
+            self.condition.notify()
+
+    def get(self, last_sequence, timeout=0.5):
+        with self.condition:
+            if self.sequence == last_sequence:
+                self.condition.wait(timeout)
+            if self.sequence == last_sequence:
+                return None, None, last_sequence
+            return self.frame, self.capture_time, self.sequence
+
+class GazePipeline:
+    """
+    Capture -> preprocess -> inference running on three threads.
+
+    The capture thread keeps only the latest frame so the driver buffer never
+    adds latency, preprocessing (face tracking and eye crop) and Keras inference
+    overlap, and stages are joined by bounded drop-oldest queues. Eye crops are
+    normalised straight into slots of a preallocated batch array and only slot
+    indices travel between threads. Every result carries its frame-to-gaze
+    latency. `camera` is anything open_camera_source accepts: a camera index,
+    a video file to replay, or None for the default.
+    """
+    WARM_UP_FRAMES = 5
+    WARM_UP_TIME = 1.0
+    MAX_READ_FAILURES = 5
+    MAX_RETRY_DELAY = 2.0
+
+    def __init__(self, gaze_predictor, on_result, camera=None, queue_size=2, scheduler=None):
+        self.gaze_predictor = gaze_predictor
+        self.on_result = on_result
+        self.scheduler = scheduler
+        self.camera = camera
+        self.latest_frame = LatestFrame()
+        self.eyes_queue = queue.Queue(maxsize=queue_size)
+        # One slot per queued crop, plus the one being inferred and the one being written
+        width, height = gaze_predictor.cropper.target_size
+        self.crops = np.empty((queue_size + 2, height, width, 3), dtype=np.float32)
+        self.free_slots = queue.Queue()
+        for slot in range(len(self.crops)):
+            self.free_slots.put(slot)
+        self.running = Event()
+        self.threads = []
+        self.dropped_frames = 0
+        self.frames_captured = 0
+        self.result_times = deque(maxlen=100)
+        self.latencies = deque(maxlen=100)
+
+    def start(self):
+        self.running.set()
+        self.threads = [
+            Thread(target=self.capture_loop, daemon=True),
+            Thread(target=self.preprocess_loop, daemon=True),
+            Thread(target=self.inference_loop, daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self, timeout=2):
+        self.running.clear()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def open_camera(self):
+        cap = open_camera_source(self.camera)
+        if not isinstance(cap, CameraSource):
+            # Replayed files have no exposure to settle
+            return cap
+        # Frames right after opening are dark while auto-exposure settles; a probe
+        # that used them would never see a user who came back without touching input
+        deadline = time.monotonic() + self.WARM_UP_TIME
+        for _ in range(self.WARM_UP_FRAMES):
+            if time.monotonic() > deadline or not self.running.is_set():
+                break
+            cap.read_latest()
+        return cap
+
+    def capture_loop(self):
+        cap = None
+        last_sample_time = 0
+        failures = 0
+        try:
+            while self.running.is_set():
+                if self.scheduler:
+                    # Sleep until the scheduler's next sample instead of reading every frame;
+                    # the interval is re-read so a state change takes effect immediately
+                    delay = last_sample_time + self.scheduler.interval() - time.monotonic()
+                    if delay > 0:
+                        time.sleep(min(delay, 0.5))
+                        continue
+                    last_sample_time = time.monotonic()
+                if cap is None:
+                    cap = self.open_camera()
+                ret, frame = cap.read_latest()
+                if not ret:
+                    failures += 1
+                    # A replayed file has simply ended; reopening it would start it over
+                    if not isinstance(cap, CameraSource) or failures > self.MAX_READ_FAILURES:
+                        print("Failed to capture image from webcam")
+                        break
+                    # Drivers often fail a read or two around a reopen: reopen and back off
+                    cap.release()
+                    cap = None
+                    time.sleep(min(self.MAX_RETRY_DELAY, 0.1 * 2 ** failures))
+                    continue
+                failures = 0
+                self.frames_captured += 1
+                self.latest_frame.put(frame, time.perf_counter())
+                if self.scheduler and self.scheduler.should_release_camera():
+                    # Long gaps between samples: let the camera (and its LED) turn off
+                    cap.release()
+                    cap = None
+        finally:
+            if cap is not None:
+                cap.release()
+            self.running.clear()
+
+    def preprocess_loop(self):
+        sequence = 0
+        processed = 0
+        while self.running.is_set():
+            frame, capture_time, new_sequence = self.latest_frame.get(sequence)
+            if frame is None:
+                continue
+            # Frames overwritten before we got to them were skipped on purpose
+            self.dropped_frames += new_sequence - sequence - 1 if processed else 0
+            sequence = new_sequence
+            processed += 1
+            # Never empty: the queue and the inference thread hold at most len(crops) - 1 slots
+            slot = self.free_slots.get()
+            combined_eyes = self.gaze_predictor.get_combined_eyes(
+                frame, self.gaze_predictor.global_detector, self.gaze_predictor.global_predictor, out=self.crops[slot])
+            if self.scheduler:
+                self.scheduler.record_sample(combined_eyes is not None)
+            if combined_eyes is None:
+                self.free_slots.put(slot)
+                continue
+            self.dropped_frames += put_drop_oldest(self.eyes_queue, (slot, capture_time),
+                                                   on_drop=lambda item: self.free_slots.put(item[0]))
+
+    def inference_loop(self):
+        while self.running.is_set():
+            try:
+                slot, capture_time = self.eyes_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                gaze_x, gaze_y, adjusted_x, adjusted_y = self.gaze_predictor.predict_from_eyes(self.crops[slot])
+            finally:
+                self.free_slots.put(slot)
+            now = time.perf_counter()
+            latency = now - capture_time
+            self.result_times.append(now)
+            self.latencies.append(latency)
+            self.on_result({
+                "gaze": (gaze_x, gaze_y),
+                "adjusted_gaze": (adjusted_x, adjusted_y),
+                "latency": latency,
+            })
+
+    def get_stats(self):
+        predictions_per_second = 0.0
+        if len(self.result_times) > 1:
+            span = self.result_times[-1] - self.result_times[0]
+            predictions_per_second = (len(self.result_times) - 1) / span if span > 0 else 0.0
+        mean_latency = sum(self.latencies) / len(self.latencies) if self.latencies else None
+        return {
+            "frames_captured": self.frames_captured,
+            "dropped_frames": self.dropped_frames,
+            "predictions_per_second": predictions_per_second,
+            "mean_latency": mean_latency,
+        }
@@ -1,48 +1,152 @@
 import dlib
+import time
 import numpy as np
-import pickle
-from collections import deque
-from keras.models import load_model
+from collections import defaultdict
 import cv2
-#improt to get the screen dimensions
-import pyautogui as pag
+from inference_server import InferenceServer
+from eye_crop import EyeCropper, landmarks_to_array
+from model_registry import registry, GAZE_MODEL_PATH, ADJUSTMENT_MODEL_PATH, SHAPE_PREDICTOR_PATH
 class GazePredictor:
-    def __init__(self, model_path, adjustment_model_path, shape_predictor_path, screen_dimensions=(pag.size()[0], pag.size()[1])):
+    def __init__(self, model_path, adjustment_model_path, shape_predictor_path, screen_dimensions=None,
+                 tracking=True, detect_every=10, roi_padding=0.1, detection_scale=1.0,
+                 max_batch_size=16, max_batch_wait=0.002, producers=1):
+        if screen_dimensions is None:
+            # pyautogui needs a display, so it is only imported when the screen size is required
+            import pyautogui as pag
+            screen_dimensions = pag.size()
         self.screen_width, self.screen_height = screen_dimensions
-        self.global_detector = dlib.get_frontal_face_detector()
-        self.global_predictor = dlib.shape_predictor(shape_predictor_path)
-        self.model = self.load_keras_model(model_path)
-        self.adjustment_model = self.load_pickle_model(adjustment_model_path)
-        self.gaze_points_queue = deque(maxlen=5)
-        self.adjusted_gaze_points_queue = deque(maxlen=5)
-
-    def load_keras_model(self, model_path):
-        return load_model(model_path)
-
-    def load_pickle_model(self, model_path):
-        with open(model_path, 'rb') as f:
-            return pickle.load(f)
-        
-    def extract_eye_region(self, image, landmarks, left_eye_points, right_eye_points, nose_bridge_points, forehead_points):
-        # Combine the eye, nose bridge, and forehead points
-        eye_points = left_eye_points + right_eye_points
-        all_points = eye_points + nose_bridge_points + forehead_points
-
-        # Extract the coordinates of the combined points
-        region = np.array([(landmarks.part(point).x, landmarks.part(point).y) for point in all_points])
-
-        # Find the bounding box coordinates
-        min_x = np.min(region[:, 0])
-        max_x = np.max(region[:, 0])
-        min_y = np.min(region[:, 1])
-        max_y = np.max(region[:, 1])
-
-        # Crop the region to create a rectangle
-        cropped_region = image[min_y:max_y, min_x:max_x]
-
-        return cropped_region, (min_x, min_y, max_x, max_y)
-        
-    def get_combined_eyes(self, frame, global_detector, global_predictor, target_size=(200, 100)):
+        # Models are shared through the registry and only loaded on first use
+        self.model_path = model_path
+        self.adjustment_model_path = adjustment_model_path
+        self.shape_predictor_path = shape_predictor_path
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait = max_batch_wait
+        # Threads calling predict_from_eyes concurrently; micro-batching only pays off with several
+        self.producers = producers
+        self._inference_server = None
+        self.cropper = EyeCropper()
+        self.landmark_points = np.empty((68, 2), dtype=np.int32)
+
+        # Face tracking: full HOG detection only every `detect_every` frames or when
+        # tracking is lost; in between the face box is derived from the last landmarks
+        self.tracking = tracking
+        self.detect_every = detect_every
+        self.roi_padding = roi_padding
+        self.detection_scale = detection_scale
+        self.tracked_face = None
+        self.frames_since_detection = 0
+        self.stage_times = defaultdict(float)
+        self.stage_counts = defaultdict(int)
+        self.detection_runs = 0
+        self.tracked_frames = 0
+
+    def record_stage(self, stage, start_time):
+        self.stage_times[stage] += time.perf_counter() - start_time
+        self.stage_counts[stage] += 1
+
+    def get_stage_timings(self):
+        # Mean milliseconds per call for each stage of the gaze pipeline
+        timings = {stage: 1000 * self.stage_times[stage] / self.stage_counts[stage] for stage in self.stage_times}
+        timings['detection_runs'] = self.detection_runs
+        timings['tracked_frames'] = self.tracked_frames
+        return timings
+
+    def reset_stage_timings(self):
+        self.stage_times.clear()
+        self.stage_counts.clear()
+        self.detection_runs = 0
+        self.tracked_frames = 0
+
+    def reset_tracking(self):
+        self.tracked_face = None
+        self.frames_since_detection = 0
+
+    @property
+    def global_detector(self):
+        return registry.get('face_detector')
+
+    @property
+    def global_predictor(self):
+        return registry.get('shape_predictor', self.shape_predictor_path)
+
+    @property
+    def model(self):
+        return registry.get('gaze_model', self.model_path)
+
+    @property
+    def adjustment_model(self):
+        # Looked up on every call so a recalibrated model is picked up without a restart
+        return registry.get('adjustment_model', self.adjustment_model_path)
+
+    @property
+    def inference_server(self):
+        if self._inference_server is None:
+            self._inference_server = InferenceServer(self.model, max_batch_size=self.max_batch_size, max_wait=self.max_batch_wait)
+        return self._inference_server
+
+    def warm_up(self):
+        registry.get('face_detector')
+        registry.get('shape_predictor', self.shape_predictor_path)
+        registry.get('adjustment_model', self.adjustment_model_path)
+        self.inference_server.warm_up()
+
+    def detect_face(self, gray, global_detector):
+        start = time.perf_counter()
+        if self.detection_scale != 1.0:
+            small = cv2.resize(gray, None, fx=self.detection_scale, fy=self.detection_scale, interpolation=cv2.INTER_AREA)
+            faces = [
+                dlib.rectangle(int(f.left() / self.detection_scale), int(f.top() / self.detection_scale),
+                               int(f.right() / self.detection_scale), int(f.bottom() / self.detection_scale))
+                for f in global_detector(small)
+            ]
+        else:
+            faces = list(global_detector(gray))
+        self.record_stage('detect', start)
+        self.detection_runs += 1
+        self.frames_since_detection = 0
+        # The largest face is the user sitting in front of the camera
+        return max(faces, key=lambda f: f.area()) if faces else None
+
+    def face_from_landmarks(self, landmarks, frame_shape):
+        points = landmarks_to_array(landmarks, out=self.landmark_points)
+        min_x, min_y = points.min(axis=0)
+        max_x, max_y = points.max(axis=0)
+        pad_x = int((max_x - min_x) * self.roi_padding)
+        pad_y = int((max_y - min_y) * self.roi_padding)
+        height, width = frame_shape[:2]
+        return dlib.rectangle(max(0, int(min_x) - pad_x), max(0, int(min_y) - pad_y),
+                              min(width - 1, int(max_x) + pad_x), min(height - 1, int(max_y) + pad_y))
+
+    def is_tracking_plausible(self, previous_face, new_face):
+        # A shape predictor run on the wrong region collapses or explodes the box
+        if new_face.width() < 20 or new_face.height() < 20:
+            return False
+        ratio = new_face.area() / max(1, previous_face.area())
+        return 0.6 < ratio < 1.6
+
+    def find_landmarks(self, gray, global_detector, global_predictor):
+        tracked = self.tracking and self.tracked_face is not None and self.frames_since_detection < self.detect_every
+        face = self.tracked_face if tracked else self.detect_face(gray, global_detector)
+        if face is None:
+            self.reset_tracking()
+            return None
+
+        start = time.perf_counter()
+        landmarks = global_predictor(gray, face)
+        self.record_stage('landmarks', start)
+
+        new_face = self.face_from_landmarks(landmarks, gray.shape)
+        if tracked:
+            if not self.is_tracking_plausible(face, new_face):
+                # Tracking confidence dropped, fall back to a full detection on this frame
+                self.reset_tracking()
+                return self.find_landmarks(gray, global_detector, global_predictor)
+            self.tracked_frames += 1
+        self.frames_since_detection += 1
+        self.tracked_face = new_face if self.tracking else None
+        return landmarks
+
+    def get_combined_eyes(self, frame, global_detector, global_predictor, target_size=(200, 100), out=None):
         """
         Detects, enhances, and combines the eye regions including the nose bridge from the frame.
         Args:
@@ -52,50 +156,73 @@ class GazePredictor:
             target_size: Target size for resizing the combined eye region.
         Returns:
             The combined eye regions including the nose bridge, or None if not detected.
+            The array is `out` if given, otherwise a reused buffer that is overwritten by the next call.
         """
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = global_detector(gray)
-
-        # super resolution image
-        for face in faces:
-            landmarks = global_predictor(gray, face)
-
-            forehead_points = [20, 21, 22, 23, 0 ,16]
-            left_eye_landmarks = [36, 37, 38, 39, 40, 41]
-            right_eye_landmarks = [42, 43, 44, 45, 46, 47]
-            nose_bridge_points = [27, 28, 29]
-
-            combined_eye_region, _ = self.extract_eye_region(
-                frame, landmarks, left_eye_landmarks, right_eye_landmarks, nose_bridge_points, forehead_points)
-
-            if isinstance(combined_eye_region, np.ndarray) and combined_eye_region.size > 0:
-                # Resize to the final target size
-                combined_eye_final_resized = cv2.resize(combined_eye_region, target_size, interpolation=cv2.INTER_AREA)
-                combined_eye_final_resized = combined_eye_final_resized.astype(np.float32) / 255.0
-                return combined_eye_final_resized
-            else:
-                # Handle the case where combined_eye_region is empty or not valid
-                return None
-        return None
+        if target_size != self.cropper.target_size:
+            self.cropper = EyeCropper(target_size)
+        gray = self.cropper.gray(frame)
+        landmarks = self.find_landmarks(gray, global_detector, global_predictor)
+        if landmarks is None:
+            return None
+
+        start = time.perf_counter()
+        # find_landmarks already converted these landmarks into landmark_points
+        combined_eyes = self.cropper.crop(frame, self.landmark_points, out=out)
+        if combined_eyes is None:
+            # Handle the case where the combined eye region is empty
+            self.reset_tracking()
+            return None
+        self.record_stage('crop', start)
+        return combined_eyes
 
     def predict_gaze(self, frame):
         combined_eyes = self.get_combined_eyes(frame, self.global_detector, self.global_predictor)
+        return self.predict_from_eyes(combined_eyes)
+
+    def predict_from_eyes(self, combined_eyes):
         if combined_eyes is not None:
-            combined_eyes = np.expand_dims(combined_eyes, axis=0)
-            predicted_gaze = self.model.predict(combined_eyes)[0][0]
+            start = time.perf_counter()
+            if self.producers > 1:
+                predicted_gaze = self.inference_server.predict_one(combined_eyes)
+            else:
+                predicted_gaze = self.inference_server.predict_direct(combined_eyes)
+            self.record_stage('inference', start)
 
             # Correctly access the elements of predicted_gaze[0]
             gaze_x_scaled = int(predicted_gaze[0] * self.screen_width)  # Access the first element for x
             gaze_y_scaled = int(predicted_gaze[1] * self.screen_height)  # Access the second element for y
 
             # Adjust gaze prediction
-            adjusted_pred = self.adjustment_model.predict(predicted_gaze.reshape(1, -1))[0]
-            adjusted_x, adjusted_y = int(adjusted_pred[0] * self.screen_width), int(adjusted_pred[1] * self.screen_height)
+            start = time.perf_counter()
+            adjusted_pred_x, adjusted_pred_y = self.adjustment_model.map_point(predicted_gaze[0], predicted_gaze[1])
+            self.record_stage('adjust', start)
+            adjusted_x, adjusted_y = int(adjusted_pred_x * self.screen_width), int(adjusted_pred_y * self.screen_height)
 
             return gaze_x_scaled, gaze_y_scaled, adjusted_x, adjusted_y
         else:
             return None, None, None, None
-        
-    def moving_average(self, new_point, queue):
-        queue.append(new_point)
-        return [sum(x) / len(queue) for x in zip(*queue)]
\ No newline at end of file
+
+if __name__ == "__main__":
+    # Replay a recorded clip with and without tracking to compare per-stage timings
+    import sys
+    from camera_source import VideoFileSource
+    clip_path = sys.argv[1]
+    for tracking in (False, True):
+        predictor = GazePredictor(
+            model_path=GAZE_MODEL_PATH,
+            adjustment_model_path=ADJUSTMENT_MODEL_PATH,
+            shape_predictor_path=SHAPE_PREDICTOR_PATH,
+            tracking=tracking,
+        )
+        cap = VideoFileSource(clip_path).open()
+        frames = 0
+        start = time.perf_counter()
+        while True:
+            ret, frame = cap.read_latest()
+            if not ret:
+                break
+            predictor.predict_gaze(frame)
+            frames += 1
+        cap.release()
+        elapsed = time.perf_counter() - start
+        print(f"tracking={tracking}: {frames / max(elapsed, 1e-9):.1f} fps, stages={predictor.get_stage_timings()}")
@@ -0,0 +1,117 @@
+import time
+from collections import deque
+from threading import Lock
+
+try:
+    import psutil
+except ImportError:  # Battery detection is optional
+    psutil = None
+
+class AdaptiveGazeScheduler:
+    """
+    Chooses how often the gaze pipeline samples the camera.
+
+    Sampling speeds up while the user is typing/moving the mouse or keeps
+    looking away from the screen, slows down when the machine is idle or on
+    battery, and drops to an occasional probe with the camera released when no
+    face has been seen for a while.
+    """
+    ACTIVE_INTERVAL = 0.15
+    NORMAL_INTERVAL = 0.3
+    IDLE_INTERVAL = 1.0
+    AWAY_PROBE_INTERVAL = 5.0
+    BATTERY_FACTOR = 2.0
+
+    def __init__(self, normal_interval=NORMAL_INTERVAL, active_window=10, idle_timeout=60,
+                 away_timeout=30, look_away_window=60, look_away_threshold=3, battery_check_interval=60):
+        self.normal_interval = normal_interval
+        self.active_window = active_window
+        self.idle_timeout = idle_timeout
+        self.away_timeout = away_timeout
+        self.look_away_window = look_away_window
+        self.look_away_threshold = look_away_threshold
+        self.battery_check_interval = battery_check_interval
+        self.lock = Lock()
+        now = time.monotonic()
+        self.last_input_time = now
+        self.last_face_time = now
+        self.last_on_screen = True
+        self.look_aways = deque()
+        self.on_battery = False
+        self.last_battery_check = 0
+        self.sample_times = deque(maxlen=200)
+        self.cpu_window_start = (now, time.process_time())
+        self.cpu_percent = 0.0
+
+    def note_input(self):
+        # Called from the pynput callbacks: a single attribute store
+        self.last_input_time = time.monotonic()
+
+    def record_sample(self, face_found):
+        now = time.monotonic()
+        self.sample_times.append(now)
+        if face_found:
+            self.last_face_time = now
+
+    def record_gaze(self, on_screen):
+        with self.lock:
+            if self.last_on_screen and not on_screen:
+                self.look_aways.append(time.monotonic())
+            self.last_on_screen = on_screen
+
+    def check_battery(self, now):
+        if psutil is None or now - self.last_battery_check < self.battery_check_interval:
+            return
+        self.last_battery_check = now
+        battery = psutil.sensors_battery()
+        self.on_battery = battery is not None and not battery.power_plugged
+
+    def state(self):
+        now = time.monotonic()
+        self.check_battery(now)
+        with self.lock:
+            while self.look_aways and now - self.look_aways[0] > self.look_away_window:
+                self.look_aways.popleft()
+            frequent_look_aways = len(self.look_aways) >= self.look_away_threshold
+        recent_input = now - self.last_input_time < self.active_window
+        # Typing or moving the mouse means the user is back, even before a probe finds the face
+        if now - self.last_face_time > self.away_timeout and not recent_input:
+            return 'away'
+        if recent_input or frequent_look_aways:
+            return 'active'
+        if now - self.last_input_time > self.idle_timeout:
+            return 'idle'
+        return 'normal'
+
+    def interval(self):
+        state = self.state()
+        if state == 'away':
+            return self.AWAY_PROBE_INTERVAL
+        interval = {
+            'active': self.ACTIVE_INTERVAL,
+            'normal': self.normal_interval,
+            'idle': self.IDLE_INTERVAL,
+        }[state]
+        return interval * self.BATTERY_FACTOR if self.on_battery else interval
+
+    def should_release_camera(self):
+        # Only the away probe is sparse enough to be worth reopening the device, and the
+        # underexposed first frames after a reopen must not push other states towards 'away'
+        return self.state() == 'away'
+
+    def get_stats(self):
+        now = time.monotonic()
+        recent = [t for t in self.sample_times if now - t <= 60]
+        effective_rate = len(recent) / 60 if recent else 0.0
+        start_time, start_cpu = self.cpu_window_start
+        cpu_now = time.process_time()
+        if now > start_time:
+            self.cpu_percent = 100 * (cpu_now - start_cpu) / (now - start_time)
+        self.cpu_window_start = (now, cpu_now)
+        return {
+            'state': self.state(),
+            'interval': self.interval(),
+            'effective_rate': effective_rate,
+            'cpu_percent': self.cpu_percent,
+            'on_battery': self.on_battery,
+        }
@@ -1,36 +1,32 @@
 import tkinter as tk
 from tkinter import messagebox
-import pyautogui as pag
-from api import register_user, login_user, has_been_calibrated, mark_as_calibrated
-from calibration_component import CalibrationComponent
-from sklearn.ensemble import RandomForestRegressor
-import numpy as np
-import pickle
+from api import register_user, login_user, resume_login, logout_user, has_been_calibrated, mark_as_calibrated
 import os
-import dlib
-from image_processor import ImageProcessor
-from keras.models import load_model
-from sklearn.preprocessing import StandardScaler
+import queue
+import threading
+from model_registry import registry, GAZE_MODEL_PATH, ADJUSTMENT_MODEL_PATH, SHAPE_PREDICTOR_PATH
+
+# numpy, keras, dlib, cv2 and pyautogui are imported inside the functions
+# that need them so the login window can appear before the ML stack is loaded
 
 def load_data(calibration_file):
-    # Load calibration data from a pickle file
-    with open(calibration_file, 'rb') as f:
-        data = pickle.load(f)
-    features = np.array(data['images'])
-    labels = np.array(data['gaze_coords'])
-    return features, labels
-
-def gaze_predict(model_path='./models/eye_gaze_v31_20.h5', calibration_file='calibration_data.pkl'):
+    # Load the calibration set written by session_format.CalibrationWriter
+    from session_format import load_calibration
+    return load_calibration(calibration_file)
+
+def gaze_predict(model_path=GAZE_MODEL_PATH, calibration_file='calibration_data', progress=None, batch_size=64):
+    from inference_server import InferenceServer
     features, labels = load_data(calibration_file)
 
-    gaze_model = load_model(model_path)
+    gaze_model = registry.get('gaze_model', model_path)
+    inference_server = InferenceServer(gaze_model, max_batch_size=batch_size)
 
-    #Predict gaze points for each image in the calibration dataset
+    # Predict gaze points for the calibration dataset in batches
     predicted_gaze_points = []
-    for image in features:
-        image_reshaped = np.expand_dims(image, axis=0)
-        predicted_point = gaze_model.predict(image_reshaped)[0][0]
-        predicted_gaze_points.append(predicted_point)
+    for start in range(0, len(features), batch_size):
+        predicted_gaze_points.extend(inference_server.predict_batch(features[start:start + batch_size]))
+        if progress:
+            progress(min(start + batch_size, len(features)) / len(features), "Scoring calibration images")
 
     # Create the dataset for the adjustment model
     adjustment_dataset = {
@@ -40,32 +36,62 @@ def gaze_predict(model_path='./models/eye_gaze_v31_20.h5', calibration_file='cal
 
     return adjustment_dataset
 
-def save_model(model, model_path='./models/adjustment_model1.h5'):
-    print("Saving model to", model_path)
-    # Save the trained model to a file
-    model.save(model_path)
-
-    print("Model saved to", model_path)
-
-
-def update_model( model_path='./models/adjustment_model.h5'):
 
-    print("Loading existing model.")
-    model = load_model(model_path)
-
-    adjusment_dataset = gaze_predict()
-
-    X = np.squeeze(np.array(adjusment_dataset['predicted_gaze_points']))  # Remove extra dimensions
-    y = np.array(adjusment_dataset['actual_gaze_points'])[:, :2]  # Remove extra dimensions
+def update_model(mapper_path=ADJUSTMENT_MODEL_PATH, progress=None, degree=2, screen_dimensions=None):
+    import numpy as np
+    from calibration_mapper import CalibrationMapper, fit_report
+    if screen_dimensions is None:
+        import pyautogui as pag
+        screen_dimensions = tuple(pag.size())
+
+    adjusment_dataset = gaze_predict(progress=progress)
+
+    predicted = adjusment_dataset['predicted_gaze_points']
+    X = np.array(predicted).reshape(len(predicted), -1)[:, :2]
+    # Calibration dots are in pixels; the mapper works in normalised screen coordinates
+    y = np.array(adjusment_dataset['actual_gaze_points'])[:, :2] / np.array(screen_dimensions)
+
+    if progress:
+        progress(1.0, "Fitting calibration mapping")
+    mapper = CalibrationMapper(degree=degree)
+    report = fit_report(mapper.fit(X, y, error_scale=screen_dimensions))
+    mapper.save(mapper_path)
+    # Hot-swap the mapper so a running monitor uses it straight away
+    registry.replace('adjustment_model', mapper_path, mapper)
+    print(f"Calibration mapping saved to {mapper_path}: mean error {report['mean_error']:.1f}px, "
+          f"max {report['max_error']:.1f}px")
+    print("Per-point error (px):", report['point_errors'])
+    return report
+
+def update_model_in_background(on_progress, on_done, widget, poll_interval=100):
+    """
+    Runs update_model on a worker thread and relays progress to the Tk thread.
+    Tk isn't thread safe, so the worker only posts to a queue that `widget` polls.
+    """
+    messages = queue.Queue()
+
+    def worker():
+        try:
+            update_model(progress=lambda fraction, message: messages.put(('progress', fraction, message)))
+            messages.put(('done', None, None))
+        except Exception as e:
+            messages.put(('error', None, str(e)))
+
+    def poll():
+        while True:
+            try:
+                kind, fraction, message = messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'progress':
+                on_progress(fraction, message)
+            else:
+                on_done(message if kind == 'error' else None)
+                return
+        widget.after(poll_interval, poll)
 
-    # Normalize the data
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-    y_scaled = scaler.fit_transform(y)
-        
-    model.fit(X, y)
-    save_model(model)
-    print("Model updated and saved.")
+    threading.Thread(target=worker, daemon=True).start()
+    widget.after(poll_interval, poll)
 
 class LoginFrame(tk.Frame):
     def __init__(self, parent, activity_monitor, show_frame):
@@ -88,22 +114,51 @@ class LoginFrame(tk.Frame):
         login_button = tk.Button(self, text="Login", command=lambda: self.attempt_login(self.username_entry.get(), password_entry.get()))
         login_button.pack()
 
+        self.status_label = tk.Label(self, text="")
+        self.status_label.pack()
+        self.try_resume_login()
+
+    def try_resume_login(self, poll_interval=100):
+        # A stored refresh token skips the password login; the request runs off the Tk thread
+        results = queue.Queue()
+        threading.Thread(target=lambda: results.put(resume_login()), daemon=True).start()
+
+        def poll():
+            try:
+                username = results.get_nowait()
+            except queue.Empty:
+                self.after(poll_interval, poll)
+                return
+            if username:
+                self.status_label.config(text=f"Signed in as {username}")
+                self.finish_login(username)
+
+        self.after(poll_interval, poll)
+
     def attempt_login(self, username, password):
         if login_user(username, password):
-            if not has_been_calibrated(username):
-                # Launch calibration process
-                self.launch_calibration(username)
-            else:
-                self.show_frame(MonitoringFrame)
+            self.finish_login(username)
         else:
             messagebox.showerror("Login failed", "The username or password is incorrect or an error occurred.")
 
+    def finish_login(self, username):
+        self.activity_monitor.warm_up_models()
+        if not has_been_calibrated(username):
+            # Launch calibration process
+            self.launch_calibration(username)
+        else:
+            self.show_frame(MonitoringFrame)
+
     def launch_calibration(self, username):
+        import pyautogui as pag
+        from calibration_component import CalibrationComponent
+        from image_processor import ImageProcessor
+
         root = tk.Toplevel()
         root.title("Calibration Component")
 
-        detector = dlib.get_frontal_face_detector()
-        predictor = dlib.shape_predictor("./models/shape_predictor_68_face_landmarks.dat")
+        detector = registry.get('face_detector')
+        predictor = registry.get('shape_predictor', SHAPE_PREDICTOR_PATH)
 
         image_processor = ImageProcessor(detector, predictor)
         root.geometry(f"{pag.size()[0]}x{pag.size()[1]}")
@@ -113,7 +168,17 @@ class LoginFrame(tk.Frame):
 
     def complete_calibration(self, username):
         mark_as_calibrated(username)
-        update_model()  # Update the model with the new calibration data
+        # Update the model with the new calibration data without freezing the UI
+        update_model_in_background(self.show_update_progress, self.finish_model_update, self)
+
+    def show_update_progress(self, fraction, message):
+        self.status_label.config(text=f"{message}: {fraction:.0%}")
+
+    def finish_model_update(self, error):
+        if error:
+            messagebox.showerror("Calibration", f"Updating the model failed: {error}")
+            return
+        self.status_label.config(text="")
         print("Calibration complete!")
         self.show_frame(MonitoringFrame)
 
@@ -126,9 +191,34 @@ class MonitoringFrame(tk.Frame):
         start_monitor_button = tk.Button(self, text="Start Monitoring", command=self.activity_monitor.start_monitoring)
         start_monitor_button.pack()
 
-        logout_button = tk.Button(self, text="Logout", command=lambda: self.show_frame(LoginFrame))
+        logout_button = tk.Button(self, text="Logout", command=self.logout)
         logout_button.pack()
 
+        self.readiness_label = tk.Label(self, text="")
+        self.readiness_label.pack()
+        self.update_readiness()
+
+    def logout(self):
+        # Stop first: ending the session and uploading what is left needs this user's token,
+        # and the uploader must not carry their session id over to the next login
+        self.activity_monitor.stop_monitoring()
+        logout_user()
+        self.show_frame(LoginFrame)
+
+    def update_readiness(self):
+        # Gaze models load in the background; show when gaze tracking can start
+        if self.activity_monitor.models_ready.is_set():
+            self.readiness_label.config(text="Gaze tracking ready")
+            return
+        if self.activity_monitor.models_loading.is_set():
+            self.readiness_label.config(text="Loading gaze models...")
+        elif self.activity_monitor.models_error:
+            self.readiness_label.config(text=f"Gaze tracking unavailable: {self.activity_monitor.models_error}")
+            # Logging in again retries the warm-up, so keep checking, just less often
+            self.after(5000, self.update_readiness)
+            return
+        self.after(500, self.update_readiness)
+
 
 def setup_gui(root, activity_monitor):
     # Create a dictionary to hold references to different frames
@@ -0,0 +1,48 @@
+import re
+import sys
+import subprocess
+
+# Modules that must not be imported before the login window is shown
+HEAVY_MODULES = ('tensorflow', 'keras', 'sklearn', 'dlib', 'cv2', 'pyautogui')
+
+def profile_imports(module="main"):
+    # `python -X importtime` writes one line per imported module to stderr
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    timings = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            timings.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return timings
+
+def main(module="main", top=15, budget_ms=None):
+    timings = profile_imports(module)
+    # Lines are in completion order, so the module's direct imports precede it at depth 1
+    end = max(i for i, t in enumerate(timings) if t[0] == module and t[3] == 0)
+    start = max([i for i, t in enumerate(timings[:end]) if t[3] == 0], default=-1) + 1
+    direct_imports = [t for t in timings[start:end] if t[3] == 1]
+    total_ms = timings[end][2] / 1000
+    print(f"Importing {module} took {total_ms:.1f} ms")
+    for name, _, cumulative_us, _ in sorted(direct_imports, key=lambda t: -t[2])[:top]:
+        print(f"{cumulative_us / 1000:10.1f} ms  {name}")
+
+    imported = {t[0].split('.')[0] for t in timings[start:end + 1]}
+    heavy = sorted(imported.intersection(HEAVY_MODULES))
+    failed = False
+    if heavy:
+        print(f"Heavy modules imported at startup: {', '.join(heavy)}")
+        failed = True
+    if budget_ms is not None and total_ms > budget_ms:
+        print(f"Startup import time exceeds budget of {budget_ms} ms")
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else None
+    sys.exit(main(budget_ms=budget))
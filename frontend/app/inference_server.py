@@ -0,0 +1,120 @@
+import time
+import queue
+from concurrent.futures import Future
+from threading import Thread, Event
+import numpy as np
+import tensorflow as tf
+
+def split_outputs(outputs):
+    # Per-sample equivalent of the `model.predict(x)[0][0]` indexing used across the app
+    if isinstance(outputs, (list, tuple)):
+        return np.asarray(outputs[0])
+    return np.asarray(outputs)[:, 0]
+
+class InferenceServer:
+    """
+    Micro-batching front end for the gaze Keras model.
+
+    Callers submit single eye crops and get a Future back. A worker thread
+    groups crops that arrive within `max_wait` seconds (up to `max_batch_size`)
+    and runs them through one pre-traced `model(x, training=False)` call,
+    avoiding the per-call overhead of `model.predict`. With a single producer
+    there is nothing to batch, so predict_direct() runs the traced call on the
+    caller's thread instead of paying the queue hop and `max_wait`.
+    """
+    def __init__(self, model, max_batch_size=16, max_wait=0.002):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        input_shape = (None,) + tuple(model.input_shape[1:])
+        self.infer = tf.function(
+            lambda x: self.model(x, training=False),
+            input_signature=[tf.TensorSpec(shape=input_shape, dtype=tf.float32)],
+        )
+        # Micro-batches are stacked into this buffer instead of a new array per batch
+        self.batch_buffer = np.empty((max_batch_size,) + tuple(model.input_shape[1:]), dtype=np.float32)
+        self.requests = queue.Queue()
+        self.running = Event()
+        self.thread = None
+        self.batches_run = 0
+        self.samples_run = 0
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.running.set()
+            self.thread = Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self, timeout=2):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def warm_up(self):
+        # Trigger tracing once so the first live frame doesn't pay for it
+        shape = tuple(self.model.input_shape[1:])
+        self.infer(tf.zeros((1,) + shape, dtype=tf.float32))
+
+    def submit(self, image):
+        future = Future()
+        self.requests.put((np.asarray(image, dtype=np.float32), future))
+        if not self.running.is_set():
+            self.start()
+        return future
+
+    def predict_one(self, image):
+        return self.submit(image).result()
+
+    def predict_direct(self, image):
+        image = np.asarray(image, dtype=np.float32)
+        return split_outputs(self.infer(tf.convert_to_tensor(image[np.newaxis])))[0]
+
+    def predict_batch(self, images):
+        """Score an array of crops directly in batches of `max_batch_size` (offline use)."""
+        images = np.asarray(images, dtype=np.float32)
+        results = []
+        for i in range(0, len(images), self.max_batch_size):
+            outputs = self.infer(tf.convert_to_tensor(images[i:i + self.max_batch_size]))
+            results.append(split_outputs(outputs))
+        if not results:
+            return np.empty((0, 2), dtype=np.float32)
+        return np.concatenate(results)
+
+    def collect_batch(self):
+        try:
+            first = self.requests.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait if self.max_wait else None
+        while len(batch) < self.max_batch_size:
+            try:
+                if deadline is None:
+                    batch.append(self.requests.get_nowait())
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while self.running.is_set():
+            batch = self.collect_batch()
+            if not batch:
+                continue
+            images = np.stack([image for image, _ in batch], out=self.batch_buffer[:len(batch)])
+            try:
+                outputs = split_outputs(self.infer(tf.convert_to_tensor(images)))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches_run += 1
+            self.samples_run += len(batch)
+            for (_, future), output in zip(batch, outputs):
+                future.set_result(output)
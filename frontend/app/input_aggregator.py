@@ -0,0 +1,208 @@
+import math
+import time
+from array import array
+from datetime import datetime
+from threading import Thread, Event
+
+# Event kinds stored in the mouse ring buffer
+MOUSE_MOVE = 0
+MOUSE_PRESS = 1
+MOUSE_RELEASE = 2
+
+class InputRingBuffer:
+    """
+    Fixed-size ring of (kind, monotonic time, x, y) records in typed arrays.
+
+    Meant for a single producer (one pynput listener thread) and a single
+    consumer. Writing only stores into preallocated slots; if the consumer
+    falls a full ring behind, the oldest records are counted as dropped.
+    """
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.kinds = array('b', [0]) * capacity
+        self.times = array('d', [0.0]) * capacity
+        self.xs = array('i', [0]) * capacity
+        self.ys = array('i', [0]) * capacity
+        self.write_count = 0
+        self.read_count = 0
+        self.dropped = 0
+
+    def record(self, kind, timestamp, x=0, y=0):
+        index = self.write_count % self.capacity
+        self.kinds[index] = kind
+        self.times[index] = timestamp
+        self.xs[index] = x
+        self.ys[index] = y
+        # Publish the slot last so the consumer never sees a half-written record
+        self.write_count += 1
+
+    def drain(self):
+        """Yield the records written since the previous drain, oldest first."""
+        end = self.write_count
+        if end - self.read_count > self.capacity:
+            self.dropped += end - self.read_count - self.capacity
+            self.read_count = end - self.capacity
+        for position in range(self.read_count, end):
+            index = position % self.capacity
+            yield self.kinds[index], self.times[index], self.xs[index], self.ys[index]
+        self.read_count = end
+
+class InputAggregator:
+    """
+    Turns raw keyboard and mouse records into session and summary events.
+
+    Listener callbacks only call `record_key`/`record_move`/`record_click`.
+    A single worker thread wakes up every `tick` seconds, closes keyboard
+    sessions after `keyboard_session_timeout` seconds without a key press and
+    emits a mouse movement summary (distance, velocity, dwell) every
+    `mouse_summary_interval` seconds.
+    """
+    def __init__(self, log_event, keyboard_session_timeout=1, mouse_summary_interval=5, tick=0.25,
+                 dwell_threshold=0.5, on_click=None):
+        self.log_event = log_event
+        self.keyboard_session_timeout = keyboard_session_timeout
+        self.mouse_summary_interval = mouse_summary_interval
+        self.tick = tick
+        self.dwell_threshold = dwell_threshold
+        self.on_click = on_click
+        self.keys = InputRingBuffer()
+        self.mouse = InputRingBuffer(capacity=16384)
+        self.button_codes = {}
+        self.button_names = {}
+        # Monotonic timestamps are converted to wall clock only when events are emitted;
+        # process() refreshes the offset, see there
+        self.wall_clock_offset = time.time() - time.monotonic()
+        self.running = Event()
+        self.thread = None
+        self.keyboard_session_active = False
+
+        self.session_start = None
+        self.session_end = None
+        self.session_keys = 0
+        self.reset_mouse_summary(time.monotonic())
+        self.last_position = None
+        self.last_move_time = None
+        self.press_position = None
+
+    def record_key(self):
+        self.keys.record(0, time.monotonic())
+
+    def record_move(self, x, y):
+        self.mouse.record(MOUSE_MOVE, time.monotonic(), int(x), int(y))
+
+    def record_click(self, x, y, button, pressed):
+        code = self.button_codes.get(button)
+        if code is None:
+            code = self.button_codes[button] = len(self.button_codes)
+            self.button_names[code] = str(button)
+        # The button code shares the kind byte: kind + 3 * code
+        self.mouse.record((MOUSE_PRESS if pressed else MOUSE_RELEASE) + 3 * code, time.monotonic(), int(x), int(y))
+
+    def to_isoformat(self, monotonic_time):
+        return datetime.fromtimestamp(self.wall_clock_offset + monotonic_time).isoformat()
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.running.set()
+            self.thread = Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=2):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+        # Flush whatever is still open
+        now = time.monotonic()
+        self.process(now)
+        self.end_keyboard_session()
+        self.emit_mouse_summary(now)
+
+    def run(self):
+        while self.running.is_set():
+            time.sleep(self.tick)
+            self.process(time.monotonic())
+
+    def process(self, now):
+        # The monotonic clock stops during suspend and NTP steps the wall clock, so the
+        # offset is re-read every tick; records drained now are at most a tick old
+        self.wall_clock_offset = time.time() - time.monotonic()
+        for _, timestamp, _, _ in self.keys.drain():
+            if self.session_keys and timestamp - self.session_end > self.keyboard_session_timeout:
+                self.end_keyboard_session()
+            if not self.session_keys:
+                self.session_start = timestamp
+            self.session_end = timestamp
+            self.session_keys += 1
+            self.keyboard_session_active = True
+        if self.session_keys and now - self.session_end > self.keyboard_session_timeout:
+            self.end_keyboard_session()
+
+        for kind, timestamp, x, y in self.mouse.drain():
+            if kind == MOUSE_MOVE:
+                self.add_mouse_move(timestamp, x, y)
+            else:
+                self.handle_click(kind, timestamp, x, y)
+        if now - self.summary_start >= self.mouse_summary_interval:
+            self.emit_mouse_summary(now)
+
+    def end_keyboard_session(self):
+        if self.session_keys:
+            self.log_event('keyboard_session', {
+                'start_time': self.to_isoformat(self.session_start),
+                'end_time': self.to_isoformat(self.session_end),
+                'key_strokes': self.session_keys
+            })
+        self.session_keys = 0
+        self.keyboard_session_active = False
+
+    def handle_click(self, kind, timestamp, x, y):
+        button = self.button_names[kind // 3]
+        if kind % 3 == MOUSE_PRESS:
+            self.log_event('mouse_click', {'position': (x, y), 'button': button})
+            self.press_position = (x, y)
+            if self.on_click:
+                self.on_click(x, y, timestamp)
+        elif self.press_position:
+            self.log_event('mouse_movement', {'start_position': self.press_position, 'end_position': (x, y)})
+            self.press_position = None
+
+    def reset_mouse_summary(self, now):
+        self.summary_start = now
+        self.summary_moves = 0
+        self.summary_distance = 0.0
+        self.summary_peak_velocity = 0.0
+        self.summary_moving_time = 0.0
+        self.summary_start_position = None
+
+    def add_mouse_move(self, timestamp, x, y):
+        if self.summary_start_position is None:
+            self.summary_start_position = (x, y)
+        if self.last_position is not None:
+            distance = math.hypot(x - self.last_position[0], y - self.last_position[1])
+            elapsed = timestamp - self.last_move_time
+            self.summary_distance += distance
+            # Gaps longer than the dwell threshold count as the pointer resting
+            if 0 < elapsed <= self.dwell_threshold:
+                self.summary_moving_time += elapsed
+                self.summary_peak_velocity = max(self.summary_peak_velocity, distance / elapsed)
+        self.summary_moves += 1
+        self.last_position = (x, y)
+        self.last_move_time = timestamp
+
+    def emit_mouse_summary(self, now):
+        if self.summary_moves:
+            duration = now - self.summary_start
+            self.log_event('mouse_summary', {
+                'start_time': self.to_isoformat(self.summary_start),
+                'end_time': self.to_isoformat(now),
+                'moves': self.summary_moves,
+                'start_position': self.summary_start_position,
+                'end_position': self.last_position,
+                'distance': round(self.summary_distance, 1),
+                'mean_velocity': round(self.summary_distance / self.summary_moving_time, 1) if self.summary_moving_time else 0.0,
+                'peak_velocity': round(self.summary_peak_velocity, 1),
+                'dwell_time': round(max(0.0, duration - self.summary_moving_time), 3),
+                'dropped_records': self.mouse.dropped + self.keys.dropped
+            })
+        self.reset_mouse_summary(now)
@@ -0,0 +1,72 @@
+import os
+from threading import Lock
+
+GAZE_MODEL_PATH = './models/eye_gaze_v31_20.h5'
+ADJUSTMENT_MODEL_PATH = './models/adjustment_mapper.npz'
+SHAPE_PREDICTOR_PATH = './models/shape_predictor_68_face_landmarks.dat'
+
+# Heavy libraries are imported inside the loaders so importing the registry stays cheap
+def load_gaze_model(path):
+    from keras.models import load_model
+    return load_model(path)
+
+def load_adjustment_model(path):
+    from calibration_mapper import CalibrationMapper
+    if not os.path.exists(path):
+        # Not calibrated yet: an identity mapper passes the raw predictions through
+        print(f"No calibration found at {path}, using uncalibrated gaze")
+        return CalibrationMapper()
+    return CalibrationMapper.load(path)
+
+def load_shape_predictor(path):
+    import dlib
+    return dlib.shape_predictor(path)
+
+def load_face_detector(path=None):
+    import dlib
+    return dlib.get_frontal_face_detector()
+
+class ModelRegistry:
+    """
+    Process-wide cache of model artifacts.
+
+    Each (kind, path) pair is loaded once, on first use, no matter how many
+    components ask for it or from which thread. Artifacts can be replaced in
+    place (e.g. after recalibration); holders that look models up through the
+    registry pick up the new one immediately.
+    """
+    def __init__(self):
+        self.loaders = {
+            'gaze_model': load_gaze_model,
+            'adjustment_model': load_adjustment_model,
+            'shape_predictor': load_shape_predictor,
+            'face_detector': load_face_detector,
+        }
+        self.models = {}
+        self.lock = Lock()
+        self.key_locks = {}
+
+    def key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, Lock())
+
+    def get(self, kind, path=None):
+        key = (kind, path)
+        model = self.models.get(key)
+        if model is not None:
+            return model
+        # Only one thread loads a given artifact; others wait for it instead of loading a copy
+        with self.key_lock(key):
+            if key not in self.models:
+                print(f"Loading {kind} from {path}" if path else f"Loading {kind}")
+                self.models[key] = self.loaders[kind](path)
+            return self.models[key]
+
+    def is_loaded(self, kind, path=None):
+        return (kind, path) in self.models
+
+    def replace(self, kind, path, model):
+        with self.key_lock((kind, path)):
+            self.models[(kind, path)] = model
+
+registry = ModelRegistry()
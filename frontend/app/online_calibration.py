@@ -0,0 +1,141 @@
+import random
+from collections import deque
+from threading import Thread, Lock
+import numpy as np
+from model_registry import registry, ADJUSTMENT_MODEL_PATH
+
+class OnlineRecalibrator:
+    """
+    Keeps the calibration mapping from drifting by treating mouse clicks as
+    ground truth: users almost always look at what they click.
+
+    Raw gaze-model predictions from the last moments before a click are
+    paired with the click position and fed into a recursive least squares
+    (RLS) update of the mapper's polynomial coefficients. The forgetting
+    factor lets old evidence fade, clicks the current mapping misses by more
+    than `outlier_distance` pixels are ignored (the user was looking
+    elsewhere), and a bounded reservoir of accepted pairs tracks the error
+    over the whole day. Each update swaps a new mapper into the registry, so
+    the gaze loop never waits on it.
+    """
+    def __init__(self, screen_dimensions, mapper_path=ADJUSTMENT_MODEL_PATH, forgetting=0.995,
+                 prior_variance=0.01, max_variance=10.0, outlier_distance=250, window_before=0.5,
+                 window_after=0.1, min_predictions=2, reservoir_size=256, save_every=50):
+        self.screen_width, self.screen_height = screen_dimensions
+        self.mapper_path = mapper_path
+        self.forgetting = forgetting
+        self.prior_variance = prior_variance
+        self.max_variance = max_variance
+        self.outlier_distance = outlier_distance
+        self.window_before = window_before
+        self.window_after = window_after
+        self.min_predictions = min_predictions
+        self.reservoir_size = reservoir_size
+        self.save_every = save_every
+        self.lock = Lock()
+        self.save_lock = Lock()
+        self.predictions = deque(maxlen=64)
+        self.reservoir = []
+        self.base_mapper = None
+        self.coefficients = None
+        self.covariance = None
+        self.stats = {"clicks": 0, "accepted": 0, "outliers": 0, "no_gaze": 0, "saves": 0}
+
+    def record_prediction(self, timestamp, x, y):
+        # Called from the inference thread with a monotonic timestamp and normalised raw gaze
+        with self.lock:
+            self.predictions.append((timestamp, x, y))
+
+    def predictions_near(self, timestamp):
+        with self.lock:
+            return [(x, y) for t, x, y in self.predictions
+                    if timestamp - self.window_before <= t <= timestamp + self.window_after]
+
+    def current_mapper(self):
+        mapper = registry.get('adjustment_model', self.mapper_path)
+        if mapper is not self.base_mapper:
+            # First use, or a full calibration replaced the mapper: restart RLS from it
+            self.base_mapper = mapper
+            self.coefficients = np.array(mapper.coefficients, dtype=np.float64)
+            self.covariance = self.prior_variance * np.eye(len(self.coefficients))
+        return mapper
+
+    def add_click(self, x, y, timestamp):
+        """Use a click at screen pixel (x, y) and monotonic `timestamp` as a calibration sample."""
+        nearby = self.predictions_near(timestamp)
+        # The RLS state and stats are also read by save() and get_stats() on other threads
+        with self.lock:
+            self.stats["clicks"] += 1
+            if len(nearby) < self.min_predictions:
+                self.stats["no_gaze"] += 1
+                return False
+            # The median is robust to a stray frame from a saccade towards the target
+            predicted = np.median(np.array(nearby), axis=0)
+            target = np.array([x / self.screen_width, y / self.screen_height])
+
+            mapper = self.current_mapper()
+            miss = (mapper.predict(predicted)[0] - target) * (self.screen_width, self.screen_height)
+            if np.hypot(*miss) > self.outlier_distance:
+                self.stats["outliers"] += 1
+                return False
+
+            self.update(mapper, predicted, target)
+            self.add_to_reservoir(predicted, target)
+            self.stats["accepted"] += 1
+            save_due = self.stats["accepted"] % self.save_every == 0
+        if save_due:
+            Thread(target=self.save, daemon=True).start()
+        return True
+
+    def update(self, mapper, predicted, target):
+        phi = mapper.design_matrix(predicted.reshape(1, 2))[0]
+        p_phi = self.covariance @ phi
+        gain = p_phi / (self.forgetting + phi @ p_phi)
+        self.coefficients = self.coefficients + np.outer(gain, target - phi @ self.coefficients)
+        self.covariance = (self.covariance - np.outer(gain, p_phi)) / self.forgetting
+        # Without new information in some direction forgetting inflates P without bound
+        trace = np.trace(self.covariance)
+        if trace > self.max_variance:
+            self.covariance *= self.max_variance / trace
+
+        updated = mapper.with_coefficients(self.coefficients)
+        self.base_mapper = updated
+        registry.replace('adjustment_model', self.mapper_path, updated)
+
+    def add_to_reservoir(self, predicted, target):
+        # Reservoir sampling keeps a uniform sample of every accepted click in bounded memory
+        seen = self.stats["accepted"] + 1
+        if len(self.reservoir) < self.reservoir_size:
+            self.reservoir.append((predicted, target))
+        else:
+            slot = random.randrange(seen)
+            if slot < self.reservoir_size:
+                self.reservoir[slot] = (predicted, target)
+
+    def reservoir_error(self):
+        # Mean pixel error of the current mapping over the sampled clicks
+        if not self.reservoir or self.base_mapper is None:
+            return None
+        predicted = np.array([p for p, _ in self.reservoir])
+        targets = np.array([t for _, t in self.reservoir])
+        misses = (self.base_mapper.predict(predicted) - targets) * (self.screen_width, self.screen_height)
+        return float(np.hypot(misses[:, 0], misses[:, 1]).mean())
+
+    def save(self):
+        with self.lock:
+            mapper = self.base_mapper
+            if mapper is None or not self.stats["accepted"]:
+                return
+        # Mappers are immutable once published, so the file is written outside the lock
+        with self.save_lock:
+            mapper.save(self.mapper_path)
+        with self.lock:
+            self.stats["saves"] += 1
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["reservoir"] = len(self.reservoir)
+            error = self.reservoir_error()
+        stats["reservoir_error_px"] = round(error, 1) if error is not None else None
+        return stats
@@ -0,0 +1,323 @@
+"""
+Binary, columnar storage for monitoring sessions and calibration sets.
+
+Session container (a directory):
+
+    manifest.json           {"format": "focus-session", "version": 1,
+                             "columns": {name: numpy dtype string},
+                             "type_names": [...], "chunks": [{"name": ..., "rows": n}, ...]}
+    chunk-000000/<column>.npy   one plain .npy array per column (see event_store.new_columns)
+    chunk-000000/payloads.ndjson  data dicts of non-gaze events, one per line, in
+                                  payload_index order within the chunk
+
+Columns are written with numpy.save and read back with mmap_mode='r', so
+opening weeks of sessions only maps the files; pages are read when touched.
+
+Calibration set (a directory):
+
+    manifest.json      {"format": "focus-calibration", "version": 1, "points": n}
+    images.npy         float32 (n, 100, 200, 3) eye crops in [0, 1]
+    gaze_coords.npy    int32 (n, 2) screen coordinates of the calibration dots
+
+CalibrationWriter preallocates both arrays and fills them as points are
+captured; only the first `points` rows (from the manifest) are valid. It
+writes next to the set, in `<directory>.partial`, and replaces the set only
+when closed, so an abandoned calibration leaves the previous one intact.
+
+Neither format uses pickle; arrays are always loaded with allow_pickle=False.
+Run `python session_format.py --help` to convert the old JSON and pickle files.
+"""
+import os
+import json
+import shutil
+import argparse
+import itertools
+from array import array
+from datetime import datetime
+import numpy as np
+from event_store import ColumnarEventBuffer, EventBatch, GAZE_EVENT, new_columns
+
+SESSION_FORMAT = 'focus-session'
+CALIBRATION_FORMAT = 'focus-calibration'
+FORMAT_VERSION = 1
+COLUMN_DTYPES = {
+    'timestamp': '<f8', 'type_code': '|u1', 'gaze_x': '<i4', 'gaze_y': '<i4',
+    'adjusted_x': '<i4', 'adjusted_y': '<i4', 'latency_ms': '<f4', 'payload_index': '<i4',
+}
+
+def read_manifest(directory, expected_format):
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != expected_format:
+        raise ValueError(f"{directory} is not a {expected_format} container")
+    if manifest.get('version', 0) > FORMAT_VERSION:
+        raise ValueError(f"{directory} was written by a newer version of the app")
+    return manifest
+
+def write_manifest(directory, manifest):
+    # Write-then-rename so readers never see a half-written manifest
+    tmp_path = os.path.join(directory, 'manifest.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, os.path.join(directory, 'manifest.json'))
+
+class SessionWriter:
+    """
+    Accumulates drained EventBatches and writes them out as column chunks of
+    roughly `chunk_rows` rows. Call close() to write the final partial chunk.
+    """
+    def __init__(self, directory, chunk_rows=50000):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        os.makedirs(directory, exist_ok=True)
+        try:
+            self.manifest = read_manifest(directory, SESSION_FORMAT)
+        except FileNotFoundError:
+            self.manifest = {
+                'format': SESSION_FORMAT, 'version': FORMAT_VERSION,
+                'columns': COLUMN_DTYPES, 'type_names': [], 'chunks': [],
+            }
+        self.columns = new_columns()
+        self.payloads = []
+        self.type_codes = {name: code for code, name in enumerate(self.manifest['type_names'])}
+
+    def append(self, batch):
+        # Type codes are per buffer, so they are remapped onto the container's list
+        remap = []
+        for name in batch.type_names:
+            if name not in self.type_codes:
+                self.type_codes[name] = len(self.manifest['type_names'])
+                self.manifest['type_names'].append(name)
+            remap.append(self.type_codes[name])
+        for name, column in batch.columns.items():
+            if name == 'type_code':
+                self.columns[name].extend(array('B', (remap[code] for code in column)))
+            elif name == 'payload_index':
+                offset = len(self.payloads)
+                self.columns[name].extend(array('i', (i + offset if i >= 0 else -1 for i in column)))
+            else:
+                self.columns[name].extend(column)
+        self.payloads.extend(batch.payloads)
+        if len(self.columns['timestamp']) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        rows = len(self.columns['timestamp'])
+        if not rows:
+            return
+        chunk_name = f"chunk-{len(self.manifest['chunks']):06d}"
+        chunk_dir = os.path.join(self.directory, chunk_name)
+        os.makedirs(chunk_dir, exist_ok=True)
+        for name, column in self.columns.items():
+            # array.array exposes its buffer, so this is a single copy into the .npy file
+            np.save(os.path.join(chunk_dir, f"{name}.npy"), np.frombuffer(column, dtype=COLUMN_DTYPES[name]))
+        with open(os.path.join(chunk_dir, 'payloads.ndjson'), 'w', encoding='utf-8') as f:
+            for payload in self.payloads:
+                f.write(json.dumps(payload, separators=(',', ':')) + '\n')
+        self.manifest['chunks'].append({'name': chunk_name, 'rows': rows})
+        write_manifest(self.directory, self.manifest)
+        self.columns = new_columns()
+        self.payloads = []
+
+    def close(self):
+        self.flush()
+        if not os.path.exists(os.path.join(self.directory, 'manifest.json')):
+            write_manifest(self.directory, self.manifest)
+
+class SessionReader:
+    """Memory-mapped access to a session container."""
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest = read_manifest(directory, SESSION_FORMAT)
+        self.type_names = self.manifest['type_names']
+
+    def __len__(self):
+        return sum(chunk['rows'] for chunk in self.manifest['chunks'])
+
+    def chunk_columns(self, chunk):
+        chunk_dir = os.path.join(self.directory, chunk['name'])
+        return {
+            name: np.load(os.path.join(chunk_dir, f"{name}.npy"), mmap_mode='r', allow_pickle=False)
+            for name in self.manifest['columns']
+        }
+
+    def iter_chunks(self):
+        for chunk in self.manifest['chunks']:
+            yield self.chunk_columns(chunk)
+
+    def column(self, name):
+        """Return a whole column; chunks are concatenated, so prefer iter_chunks for huge sessions."""
+        parts = [columns[name] for columns in self.iter_chunks()]
+        if not parts:
+            return np.empty(0, dtype=COLUMN_DTYPES[name])
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def type_code(self, event_type):
+        return self.type_names.index(event_type)
+
+    def gaze_samples(self):
+        # Timestamps and gaze columns of every gaze sample, as arrays
+        code = self.type_code(GAZE_EVENT) if GAZE_EVENT in self.type_names else -1
+        result = {name: [] for name in ('timestamp', 'gaze_x', 'gaze_y', 'adjusted_x', 'adjusted_y', 'latency_ms')}
+        for columns in self.iter_chunks():
+            mask = columns['type_code'] == code
+            for name in result:
+                result[name].append(columns[name][mask])
+        return {name: np.concatenate(parts) if parts else np.empty(0) for name, parts in result.items()}
+
+    def payloads(self, chunk):
+        with open(os.path.join(self.directory, chunk['name'], 'payloads.ndjson'), encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def iter_records(self):
+        """Stream events in the original dict format, one chunk in memory at a time."""
+        previous = None
+        for chunk in self.manifest['chunks']:
+            mapped = self.chunk_columns(chunk)
+            columns = {name: array(np.dtype(dtype).char, mapped[name].tobytes())
+                       for name, dtype in self.manifest['columns'].items()}
+            batch = EventBatch(columns, self.payloads(chunk), self.type_names, previous)
+            yield from batch.to_records()
+            if len(batch):
+                previous = columns['timestamp'][-1]
+
+def save_calibration(directory, images, gaze_coords):
+    os.makedirs(directory, exist_ok=True)
+    images = np.asarray(images, dtype=np.float32)
+    gaze_coords = np.asarray(gaze_coords, dtype=np.int32)[:, :2]
+    np.save(os.path.join(directory, 'images.npy'), images)
+    np.save(os.path.join(directory, 'gaze_coords.npy'), gaze_coords)
+    write_manifest(directory, {'format': CALIBRATION_FORMAT, 'version': FORMAT_VERSION, 'points': len(images)})
+
+class CalibrationWriter:
+    """
+    Writes a calibration set incrementally: samples go straight into
+    memory-mapped .npy files sized for `capacity` samples, and the manifest
+    is updated after every point, so nothing is held in memory. The files
+    live in a staging directory until close() swaps it in for `directory`;
+    discard() drops it and keeps the existing set.
+    """
+    def __init__(self, directory, capacity, image_shape=(100, 200, 3)):
+        self.directory = directory
+        self.staging_directory = f"{directory}.partial"
+        # Leftovers of an earlier abandoned calibration are never resumed
+        shutil.rmtree(self.staging_directory, ignore_errors=True)
+        os.makedirs(self.staging_directory)
+        self.capacity = capacity
+        self.count = 0
+        self.images = np.lib.format.open_memmap(
+            os.path.join(self.staging_directory, 'images.npy'), mode='w+', dtype=np.float32,
+            shape=(capacity,) + tuple(image_shape))
+        self.gaze_coords = np.lib.format.open_memmap(
+            os.path.join(self.staging_directory, 'gaze_coords.npy'), mode='w+', dtype=np.int32, shape=(capacity, 2))
+        self.write_manifest()
+
+    def write_manifest(self):
+        write_manifest(self.staging_directory,
+                       {'format': CALIBRATION_FORMAT, 'version': FORMAT_VERSION, 'points': self.count})
+
+    def add(self, images, coords):
+        # All `images` were captured for the dot at `coords`
+        images = images[:self.capacity - self.count]
+        end = self.count + len(images)
+        self.images[self.count:end] = images
+        self.gaze_coords[self.count:end] = coords[:2]
+        self.images.flush()
+        self.gaze_coords.flush()
+        self.count = end
+        self.write_manifest()
+
+    def release(self):
+        if hasattr(self, 'images'):
+            self.images.flush()
+            self.gaze_coords.flush()
+            del self.images, self.gaze_coords
+
+    def close(self):
+        # Swap the finished set in; renaming the old one aside first works on Windows too
+        self.release()
+        previous = f"{self.directory}.previous"
+        shutil.rmtree(previous, ignore_errors=True)
+        if os.path.exists(self.directory):
+            os.replace(self.directory, previous)
+        os.replace(self.staging_directory, self.directory)
+        shutil.rmtree(previous, ignore_errors=True)
+
+    def discard(self):
+        self.release()
+        shutil.rmtree(self.staging_directory, ignore_errors=True)
+
+def load_calibration(directory, mmap=True):
+    manifest = read_manifest(directory, CALIBRATION_FORMAT)
+    mmap_mode = 'r' if mmap else None
+    images = np.load(os.path.join(directory, 'images.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+    gaze_coords = np.load(os.path.join(directory, 'gaze_coords.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+    # Sets from CalibrationWriter may have unused preallocated rows at the end
+    points = manifest.get('points', len(images))
+    return images[:points], gaze_coords[:points]
+
+def events_to_buffer(events, buffer=None):
+    # Rebuild columns from dict events (legacy JSON array or NDJSON journal)
+    buffer = buffer if buffer is not None else ColumnarEventBuffer()
+    for event in events:
+        timestamp = datetime.fromisoformat(event['timestamp']).timestamp()
+        data = event.get('data') or {}
+        if event['type'] == GAZE_EVENT and 'gaze_start_position' in data:
+            gaze_x, gaze_y = data['gaze_start_position']
+            adjusted_x, adjusted_y = data.get('adjusted_gaze_start_position', (0, 0))
+            buffer.append_gaze(int(gaze_x), int(gaze_y), int(adjusted_x), int(adjusted_y),
+                               data.get('latency_ms', 0.0), timestamp=timestamp)
+        else:
+            buffer.append(event['type'], data, timestamp=timestamp)
+    return buffer
+
+def iter_event_batches(events, batch_rows):
+    # Drain the rebuilt columns every `batch_rows` events so only one slice is in memory
+    buffer = ColumnarEventBuffer()
+    events = iter(events)
+    while True:
+        events_to_buffer(itertools.islice(events, batch_rows), buffer)
+        if not len(buffer):
+            return
+        yield buffer.drain()
+
+def convert_events(source, directory, chunk_rows=50000):
+    if os.path.isdir(source):
+        from event_journal import EventJournal
+        events = EventJournal(source, compress_closed=False).read_events()
+    else:
+        # The legacy format is a single JSON array, which has to be parsed whole
+        with open(source) as f:
+            events = json.load(f)
+    writer = SessionWriter(directory, chunk_rows=chunk_rows)
+    for batch in iter_event_batches(events, chunk_rows):
+        writer.append(batch)
+    writer.close()
+    return len(SessionReader(directory))
+
+def convert_calibration(pickle_path, directory):
+    # Unpickling runs arbitrary code: only convert files this app wrote on this machine
+    import pickle
+    with open(pickle_path, 'rb') as f:
+        data = pickle.load(f)
+    save_calibration(directory, data['images'], data['gaze_coords'])
+    return len(data['images'])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert legacy session and calibration files.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    events_parser = subparsers.add_parser('convert-events', help="events_data.json or a journal directory")
+    events_parser.add_argument('source')
+    events_parser.add_argument('directory')
+    calibration_parser = subparsers.add_parser('convert-calibration', help="calibration_data.pkl")
+    calibration_parser.add_argument('source')
+    calibration_parser.add_argument('directory')
+    args = parser.parse_args(argv)
+
+    if args.command == 'convert-events':
+        print(f"Converted {convert_events(args.source, args.directory)} events into {args.directory}")
+    else:
+        print(f"Converted {convert_calibration(args.source, args.directory)} calibration points into {args.directory}")
+
+if __name__ == "__main__":
+    main()